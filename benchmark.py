@@ -0,0 +1,195 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import cv2 as cv
+import motmetrics as mm
+import numpy as np
+
+from cv.features.TrackStore import TrackStore
+from cv.features.detections import nmsFilter
+from cv.features.tracking import getHistosFromImgWithBBs
+from cv.processing.bgsubtraction import createSubtractor
+from cv.processing.evaluation import StreamingMOTA
+from cv.utils.BoundingBoxArray import BoundingBoxArray
+from cv.utils.fileHandler import loadBoxes, loadIni
+from cv.utils.syntheticSequence import generateSequence
+from main import assignIds, getParams, prepareBBs
+
+
+def measure(func, memory: bool = True) -> tuple[object, float, int | None]:
+    """ Runs a stage and measures its time. The peak memory is measured in a second run (tracemalloc slows down
+    the code, so it would distort the time)
+
+    :param func: the stage (without arguments)
+    :param memory: If True, the peak memory of python/numpy allocations is measured
+    :return: Returns the result of the stage, the time in seconds and the peak memory in bytes (None if not measured)
+    """
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def benchmark(directory: str, params: dict = None, *, memory: bool = True, **sequence) -> dict:
+    """ Generates a synthetic sequence (see generateSequence) and times every stage of the tracking on it
+
+    :param directory: directory of the synthetic sequence
+    :param params: the parameters of getParams (default: getParams())
+    :param memory: If True, the peak memory of every stage is measured
+    :param sequence: parameters of generateSequence
+    :return: Returns the results (sequence, stages with seconds, fps and peak memory)
+    """
+    params = getParams() if params is None else params
+    paths = generateSequence(directory, **sequence)
+    seq_info = loadIni(paths['seqinfo'])
+    frame_count = int(seq_info['seqlength'])
+    img_shape = (int(seq_info['imheight']), int(seq_info['imwidth']))
+    binSize = [params['binSize1'], params['binSize2']]
+    weights = np.array([params['weightDist'], params['weightSize'], params['weightIou'], params['weightHistos']])
+    box_folders = [os.path.dirname(paths['det']) + os.sep, os.path.dirname(paths['gt']) + os.sep]
+
+    def load():
+        # removes the binary sidecars, so the text files are parsed
+        for folder in box_folders:
+            for file in os.listdir(folder):
+                if file.endswith('.npz'):
+                    os.remove(folder + file)
+        return [loadBoxes(folder) for folder in box_folders]
+
+    def loadCached():
+        return [loadBoxes(folder) for folder in box_folders]
+
+    def decode():
+        video = cv.VideoCapture(paths['video'])
+        while video.read()[0]:
+            pass
+        video.release()
+
+    def histograms():
+        video = cv.VideoCapture(paths['video'])
+        histos = {}
+        for frame_counter in range(1, frame_count + 1):
+            ret, frame = video.read()
+            if not ret:
+                break
+            histos[frame_counter] = getHistosFromImgWithBBs(frame, det_dict.get(frame_counter, []), binSize=binSize)
+        video.release()
+        return histos
+
+    def match():
+        highestBoxId = (i for i in range(1, 1000000))
+        tracks = TrackStore(params['max_age'], params['maxHistoInHistory'], params['histoEma'])
+        matchStats = {'cascade': 0, 'hungarian': 0, 'scored': 0, 'accepted': 0}
+        for frame_counter in range(1, frame_count + 1):
+            det_boxes_in_frame = det_dict.get(frame_counter, [])
+            histos_in_frame = histos.get(frame_counter, [])
+            assignIds(params, weights, frame_counter, img_shape, det_boxes_in_frame, histos_in_frame, tracks,
+                      highestBoxId, matchStats)
+            tracks.update(histos_in_frame, det_boxes_in_frame)
+        return matchStats
+
+    def evaluate():
+        mota = StreamingMOTA(BoundingBoxArray.fromBoxes([box for box in gt_boxes if box.class_id in [1, None]]))
+        for frame_counter in range(1, frame_count + 1):
+            boxes = det_dict.get(frame_counter, [])
+            mota.update(frame_counter, [box.box_id for box in boxes], [box.getTuple() for box in boxes])
+        return mm.metrics.create().compute(mota.acc, metrics=['mota', 'idf1', 'num_switches'])
+
+    def bgSubtraction():
+        video = cv.VideoCapture(paths['video'])
+        step = createSubtractor('MOG2')
+        while True:
+            ret, frame = video.read()
+            if not ret:
+                break
+            step(frame)
+        video.release()
+
+    stages = {}
+
+    def run(name, func):
+        result, seconds, peak = measure(func, memory)
+        stages[name] = {'seconds': seconds, 'fps': frame_count / seconds if seconds > 0 else None,
+                        'peakMemoryMB': None if peak is None else peak / 1024 ** 2}
+        return result
+
+    det_boxes, gt_boxes = run('load', load)
+    run('loadCached', loadCached)
+    own_dects = run('filter', lambda: nmsFilter(params['confFilter'], params['iouFilter'], [det_boxes])[0])
+    det_dict = prepareBBs(own_dects)
+    run('decode', decode)
+    histos = run('histogram', histograms)
+    matchStats = run('match', match)
+    summary = run('evaluate', evaluate)
+    run('bgSubtraction', bgSubtraction)
+
+    return {'sequence': {'frames': frame_count, 'width': img_shape[1], 'height': img_shape[0],
+                         'detections': len(det_boxes), 'filteredDetections': len(own_dects), **sequence},
+            'params': params,
+            'stages': stages,
+            'matches': matchStats,
+            'mota': float(summary['mota'].iloc[0]),
+            'idf1': float(summary['idf1'].iloc[0])}
+
+
+def environment() -> dict:
+    """ Versions of the environment (to compare runs of different versions) """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv.__version__,
+            'platform': platform.platform(), 'time': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def printResults(results: dict) -> None:
+    print(f'{"stage":<14}{"seconds":>10}{"fps":>12}{"peak MB":>10}')
+    for name, stage in results['stages'].items():
+        fps = '-' if stage['fps'] is None else f'{stage["fps"]:.1f}'  # None if the stage took no measurable time
+        peak = '-' if stage['peakMemoryMB'] is None else f'{stage["peakMemoryMB"]:.1f}'
+        print(f'{name:<14}{stage["seconds"]:>10.3f}{fps:>12}{peak:>10}')
+    print(f'MOTA {results["mota"]:.4f} | IDF1 {results["idf1"]:.4f} | matches {results["matches"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the tracking stages on a synthetic sequence')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--length', type=int, default=300, help='number of frames')
+    parser.add_argument('--objects', type=int, default=10, help='number of objects (density)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--out', default='out/benchmark/', help='folder of the result files')
+    parser.add_argument('--name', default=None, help='name of the result file (default: time and commit)')
+    args = parser.parse_args()
+
+    sequence = {'width': args.width, 'height': args.height, 'length': args.length, 'objects': args.objects,
+                'seed': args.seed}
+    directory = os.path.join(args.out, 'sequences',
+                             f'synth_{args.width}x{args.height}_{args.length}_{args.objects}_{args.seed}')
+    results = {'environment': environment(), **benchmark(directory, memory=not args.no_memory, **sequence)}
+    printResults(results)
+
+    os.makedirs(args.out, exist_ok=True)
+    name = args.name or f'{datetime.datetime.now():%Y%m%d_%H%M%S}_{results["environment"]["commit"]}'
+    path = os.path.join(args.out, f'{name}.json')
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Saved results to {path}')
+
+
+if __name__ == '__main__':
+    main()
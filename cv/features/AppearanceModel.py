@@ -0,0 +1,61 @@
+import numpy as np
+from numpy import ndarray
+
+from cv.features.tracking import normalizeHistos
+
+
+class AppearanceModel:
+    def __init__(self, capacity: int, size: int, ema: float = None):
+        """ Appearance of a track as a fixed-size ring buffer of its last normalized histograms (see normalizeHistos)
+
+        Since the histograms are normalized, the average correlation of a detection with all histograms
+        in the buffer is the correlation with their mean (the template), so scoring is a single dot product.
+        Memory per track is fixed: (capacity + 1) * size float32 values
+
+        :param capacity: number of histograms in the ring buffer
+        :param size: number of bins of a histogram
+        :param ema: If not None, the template is an exponential moving average with this factor instead of the mean
+        """
+        self.ema = ema
+        capacity = 1 if ema is not None else capacity  # the moving average needs no history
+        self.buffer = np.zeros((capacity, size), dtype=np.float32)
+        self.constant = np.zeros(capacity, dtype=bool)  # constant histograms correlate with 1 with everything
+        self.count = 0
+        self.position = 0
+        self.template = np.zeros(size, dtype=np.float32)
+        self.bias = 0.0  # share of constant histograms
+
+    def push(self, normalized: ndarray, constant: bool) -> None:
+        """ Adds a normalized histogram to the model (the oldest one is overwritten if the buffer is full)
+
+        :param normalized: the normalized histogram (see normalizeHistos)
+        :param constant: True if the histogram is constant
+        """
+        if self.ema is not None and self.count > 0:
+            self.template *= 1 - self.ema
+            self.template += self.ema * normalized
+            self.bias = (1 - self.ema) * self.bias + self.ema * constant
+            self.count += 1
+            return
+
+        self.buffer[self.position] = normalized
+        self.constant[self.position] = constant
+        self.position = (self.position + 1) % len(self.buffer)
+        self.count = min(self.count + 1, len(self.buffer))
+        self.template = self.buffer[:self.count].mean(axis=0)
+        self.bias = float(self.constant[:self.count].mean())
+
+    @staticmethod
+    def correlationMatrix(models: list['AppearanceModel'], histos: list[ndarray]) -> ndarray:
+        """ Average correlation (cv.HISTCMP_CORREL) of every histogram with the histograms of every model
+
+        :param models: the models of the tracks (t)
+        :param histos: the histograms of the detections (d)
+        :return: (t, d) matrix of correlations
+        """
+        normalized, constant = normalizeHistos(histos)
+        templates = np.array([model.template for model in models])
+        biases = np.array([model.bias for model in models])
+        correlations = templates @ normalized.T.astype(np.float32) + biases[:, None]
+        correlations[:, constant] = 1
+        return correlations
@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+import cv2 as cv
+import numpy as np
+from numpy import ndarray
+
+from cv.features.tracking import getHistosFromImgWithBBs
+from cv.utils.CacheManager import CacheManager
+from cv.utils.BoundingBox import BoundingBox
+from cv.utils.video import FramePrefetcher
+
+
+class HistogramStore:
+    def __init__(self, video_path: str, boxes: list[BoundingBox], binSize: list[int], name: str, *,
+                 path: str = 'out/histos/', cache: CacheManager = None, printInfo: bool = True):
+        """ On-disk store of the histograms of all detections of a video (memory-mapped .npy, one row per detection)
+
+        A histogram only depends on the frame, the (rounded) box and the bin sizes, so the rows are keyed by these.
+        The file name contains the bin sizes and a fingerprint of all keys, so the store is rebuilt
+        automatically if the detections or the bin sizes change. Stores of older detections are not deleted here
+        (another run may still use them), they are registered in the cache manifest and evicted by its budget
+
+        :param video_path: path of the video file (only decoded if the store has to be built)
+        :param boxes: all detections of the video (unfiltered, so changing the filters does not need a rebuild)
+        :param binSize: bin sizes of the histograms
+        :param name: name of the video (folder of the store)
+        :param path: path of the cache folder (own folder, so its entries are not evicted by other caches)
+        :param cache: manager of the cache folder (None = a manager of path without budget)
+        :param printInfo: If True, prints a message when the store is built
+        """
+        self.binSize = binSize
+        keys = np.array([HistogramStore.key(box) for box in boxes], dtype=np.int64).reshape(-1, 5)
+        fingerprint = hashlib.sha1(keys.tobytes()).hexdigest()[:16]
+        folder = os.path.join(path, name)
+        self.file = os.path.join(folder, f'histos_{binSize[0]}x{binSize[1]}_{fingerprint}.npy')
+
+        cache = CacheManager(path) if cache is None else cache
+        if not cache.lookup(self.file):
+            if printInfo:
+                print(f'Building histogram store {self.file}')
+            os.makedirs(folder, exist_ok=True)
+            self.__build(video_path, boxes)
+            cache.register(self.file)
+
+        self.histos = np.load(self.file, mmap_mode='r')
+        self.rows = {key: row for row, key in enumerate(map(tuple, keys.tolist()))}
+
+    @staticmethod
+    def key(box: BoundingBox) -> tuple[int, int, int, int, int]:
+        """ The key of a detection; the same values as used to crop the image in getHistosFromImgWithBBs """
+        return box.frame, round(box.top), round(box.bottom), round(box.left), round(box.right)
+
+    def __build(self, video_path: str, boxes: list[BoundingBox]) -> None:
+        """ Decodes the video once and writes the histogram of every detection to its row """
+        by_frame: dict[int, list[int]] = {}
+        for row, box in enumerate(boxes):
+            by_frame.setdefault(box.frame, []).append(row)
+
+        tmp_file = f'{self.file}.{os.getpid()}.tmp.npy'  # concurrent runs building the same store do not collide
+        histos = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=np.float32,
+                                           shape=(len(boxes), self.binSize[0], self.binSize[1]))
+        video = FramePrefetcher(cv.VideoCapture(video_path))
+        frame_counter = 0
+        while True:
+            ret, frame = video.read()
+            frame_counter += 1
+            if not ret:
+                break
+            rows = by_frame.get(frame_counter, [])
+            for row, histo in zip(rows, getHistosFromImgWithBBs(frame, [boxes[row] for row in rows],
+                                                                 binSize=self.binSize)):
+                histos[row] = histo
+        video.release()
+        histos.flush()
+        del histos
+        os.replace(tmp_file, self.file)
+
+    def get(self, boxes: list[BoundingBox]) -> list[ndarray]:
+        """ Returns the histograms of the boxes (same as getHistosFromImgWithBBs)
+
+        :param boxes: detections of the video
+        :return: list of histograms
+        """
+        return [self.histos[self.rows[HistogramStore.key(box)]] for box in boxes]
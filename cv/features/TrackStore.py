@@ -0,0 +1,77 @@
+from numpy import ndarray
+
+from cv.features.AppearanceModel import AppearanceModel
+from cv.features.tracking import normalizeHistos
+from cv.utils.BoundingBox import BoundingBox
+
+
+class TrackStore:
+    def __init__(self, max_age: int, maxHistos: int, ema: float = None):
+        """ Stores the latest box and the appearance model of every live track
+
+        :param max_age: Maximum age (in frames) of a track before it is evicted
+        :param maxHistos: max number of histos to keep in history
+        :param ema: If not None, the appearance is an exponential moving average with this factor (see AppearanceModel)
+        """
+        self.max_age = max_age
+        # the old list based history already dropped the oldest histo when it reached maxHistos
+        self.capacity = max(maxHistos - 1, 1)
+        self.ema = ema
+        self.tracks: dict[int, list] = {}  # key: box_id, value: [latest_bb, appearance_model]
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __contains__(self, box_id):
+        return box_id in self.tracks
+
+    def __getitem__(self, box_id) -> list:
+        return self.tracks[box_id]
+
+    def items(self):
+        return self.tracks.items()
+
+    @property
+    def ids(self) -> list[int]:
+        """ The ids of all live tracks; the order defines the rows of the score matrix """
+        return list(self.tracks.keys())
+
+    @property
+    def boxes(self) -> list[BoundingBox]:
+        """ The latest box of every live track (same order as ids) """
+        return [item[0] for item in self.tracks.values()]
+
+    @property
+    def models(self) -> list[AppearanceModel]:
+        """ The appearance model of every live track (same order as ids) """
+        return [item[1] for item in self.tracks.values()]
+
+    def prune(self, curFrameCount: int) -> int:
+        """ Evicts all tracks which were not seen for more than max_age frames
+
+        :param curFrameCount: Current frame count
+        :return: Number of evicted tracks
+        """
+        expired = [key for key, item in self.tracks.items() if item[0].frame < curFrameCount - self.max_age]
+        for key in expired:
+            del self.tracks[key]
+        return len(expired)
+
+    def update(self, histos_in_frame: list[ndarray], boxesInFrame: list[BoundingBox]) -> None:
+        """ Saves the histos plus the box itself of the current frame to the tracks
+
+        :param histos_in_frame: list of histos
+        :param boxesInFrame: list of boxes
+        """
+        if not histos_in_frame:
+            return
+        normalized, constant = normalizeHistos(histos_in_frame)
+        for box_in_frame, histo, is_constant in zip(boxesInFrame, normalized, constant):
+            if box_in_frame.box_id == -2:
+                continue
+            if box_in_frame.box_id not in self.tracks:
+                self.tracks[box_in_frame.box_id] = [box_in_frame, AppearanceModel(self.capacity, len(histo),
+                                                                                  self.ema)]
+            else:
+                self.tracks[box_in_frame.box_id][0] = box_in_frame
+            self.tracks[box_in_frame.box_id][1].push(histo, is_constant)
@@ -1,8 +1,16 @@
 import numpy as np
 from numpy import ndarray
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
+from cv.features.AppearanceModel import AppearanceModel
+from cv.features.TrackStore import TrackStore
 from cv.utils.BoundingBox import BoundingBox
+from cv.utils.BoundingBoxArray import BoundingBoxArray
+from cv.utils.spatial import radiusPairs
+
+GATE_COST = 1e8  # cost of pairs outside the gate
 
 
 def confidenceFilter(threshold, own_dects: list[list[BoundingBox]]):
@@ -24,24 +32,7 @@ def iouFilter(threshold, all_boxes: list[list[BoundingBox]]):
     :return: Filtered list of lists of boxes
     """
     for video in all_boxes:
-        frame_count = video[-1].frame
-        for frame in range(frame_count):
-            boxes_in_frame = list(filter(lambda x: x.frame == frame, video))
-            deleted = []
-            for box in boxes_in_frame:
-                if box in deleted:
-                    continue
-                for other_box in boxes_in_frame:
-                    if box is not other_box:
-                        iou = BoundingBox.intersectionOverUnion(box, other_box)
-                        lowerConfBox = box if box.confidence <= other_box.confidence else other_box
-                        if iou > threshold:
-                            try:
-                                video.remove(lowerConfBox)
-                                deleted.append(lowerConfBox)
-                            except ValueError:
-                                pass
-                            break
+        video[:] = _filterFrames(video, lambda columns: _iouSuppression(threshold, columns))
     return all_boxes
 
 
@@ -52,53 +43,272 @@ def overlapFilter(all_boxes: list[list[BoundingBox]]):
     :return: Filtered list of lists of boxes
     """
     for video in all_boxes:
-        frame_count = video[-1].frame
-        for frame in range(frame_count):
-            boxes_in_frame = list(filter(lambda x: x.frame == frame, video))
-            deleted = []
-            for box in boxes_in_frame:
-                if box in deleted:
-                    continue
-                for other_box in boxes_in_frame:
-                    if box is not other_box:
-                        # gets bigger box
-                        bigger_box: BoundingBox = box if box.area >= other_box.area else other_box
-                        smaller_box: BoundingBox = box if box.area < other_box.area else other_box
-                        if bigger_box.overlaps(smaller_box):
-                            try:
-                                video.remove(bigger_box)
-                                deleted.append(bigger_box)
-                            except ValueError:
-                                pass
-                            break
+        video[:] = _filterFrames(video, _overlapSuppression)
     return all_boxes
 
 
-def hungarianMatching(curBoxes, curFrame, curHistos, curFrameCount, history, weights, MAX_AGE) -> tuple[
-    list[int], list[int], ndarray[ndarray[float]]]:
-    """ Matches the current boxes to the history boxes using the hungarian algorithm
+def nmsFilter(confThreshold, iouThreshold, own_dects: list[list[BoundingBox]]) -> list[list[BoundingBox]]:
+    """ Applies confidenceFilter, iouFilter and overlapFilter in one pass.
+    The detections are grouped by frame once and every frame is suppressed with matrix operations
+
+    :param confThreshold: threshold for confidence
+    :param iouThreshold: iou threshold
+    :param own_dects: detections to filter (not modified)
+    :return: filtered detections (same survivors as the chain of the three filters)
+    """
+    return [_filterFrames([box for box in video if box.confidence > confThreshold],
+                          lambda columns: _iouSuppression(iouThreshold, columns), _overlapSuppression)
+            for video in own_dects]
+
+
+def _filterFrames(video: list[BoundingBox], *suppressions) -> list[BoundingBox]:
+    """ Runs the suppressions one after another on every frame of a video
+
+    :param video: every box in the video
+    :param suppressions: functions getting the boxes of one frame and returning a keep mask
+    :return: the surviving boxes in their original order
+    """
+    if not video:
+        return video
+    boxes = BoundingBoxArray.fromBoxes(video)
+    keep = np.ones(len(video), dtype=bool)
+    # the filters never looked at the frame of the last box (range(frame_count)), kept for the same results
+    order = np.flatnonzero(boxes.frame < video[-1].frame)
+    order = order[np.argsort(boxes.frame[order], kind='stable')]
+    _, starts = np.unique(boxes.frame[order], return_index=True)
+    for indexes in np.split(order, starts[1:]):
+        survivors = indexes
+        for suppression in suppressions:
+            survivors = survivors[suppression(boxes[survivors])]
+        keep[indexes] = False
+        keep[survivors] = True
+    return [box for box, kept in zip(video, keep) if kept]
+
+
+def _resolveSuppression(hits: ndarray, victims: ndarray) -> ndarray:
+    """ Replays the greedy loop of the filters: every box which is not deleted yet deletes the victim
+    of its first hit (hits include boxes which are already deleted)
+
+    :param hits: (n, n) bool matrix; hits[i, j] if box i is in conflict with box j
+    :param victims: (n, n) index matrix; which of the two boxes gets deleted
+    :return: keep mask
+    """
+    if len(hits) == 0:
+        return np.ones(0, dtype=bool)
+    np.fill_diagonal(hits, False)
+    first = hits.argmax(axis=1)
+    deleted = np.zeros(len(hits), dtype=bool)
+    for i in np.flatnonzero(hits.any(axis=1)):
+        if not deleted[i]:
+            deleted[victims[i, first[i]]] = True
+    return ~deleted
+
+
+def _iouSuppression(threshold, boxes: BoundingBoxArray) -> ndarray:
+    """ Keep mask of one frame for iouFilter: of two boxes with iou > threshold the lower confidence is deleted
+
+    :param threshold: iou threshold
+    :param boxes: the boxes of the frame
+    :return: keep mask
+    """
+    iou = BoundingBoxArray.intersectionOverUnion(boxes, boxes)
+    indexes = np.arange(len(boxes))
+    victims = np.where(boxes.confidence[:, None] <= boxes.confidence[None, :], indexes[:, None], indexes[None, :])
+    return _resolveSuppression(iou > threshold, victims)
+
+
+def _overlapSuppression(boxes: BoundingBoxArray) -> ndarray:
+    """ Keep mask of one frame for overlapFilter: a box which completely contains another box is deleted
+
+    :param boxes: the boxes of the frame
+    :return: keep mask
+    """
+    contains = BoundingBoxArray.overlaps(boxes, boxes)
+    bigger = boxes.area[:, None] >= boxes.area[None, :]
+    indexes = np.arange(len(boxes))
+    victims = np.where(bigger, indexes[:, None], indexes[None, :])
+    return _resolveSuppression(np.where(bigger, contains, contains.T), victims)
+
+
+def similarityMatrix(trackBoxes: BoundingBoxArray, trackModels: list[AppearanceModel], detBoxes: BoundingBoxArray,
+                     detHistos: list[ndarray], img_shape: tuple, weights) -> ndarray:
+    """ Calculates BoundingBox.similarity for every (track, detection) pair at once
+
+    :param trackBoxes: The latest box of every track
+    :param trackModels: The appearance model of every track (histogram history)
+    :param detBoxes: The detections
+    :param detHistos: histogram of every detection
+    :param img_shape: The shape of the image/frame
+    :param weights: The weights of the similarity terms (distance, size, iou, histogram)
+    :return: (t, d) matrix of similarities (0 = identical, 1 = completely different)
+    """
+    if len(trackBoxes) == 0 or len(detBoxes) == 0:
+        return np.empty((len(trackBoxes), len(detBoxes)))
+
+    distance = BoundingBoxArray.distance(trackBoxes, detBoxes)
+    size_difference = np.abs(trackBoxes.area[:, None] - detBoxes.area[None, :])
+    iou = BoundingBoxArray.intersectionOverUnion(trackBoxes, detBoxes)
+    # average correlation with the histogram history of every track (one dot product per pair)
+    avg_histo_similarity = AppearanceModel.correlationMatrix(trackModels, detHistos)
+
+    # Normalizes the values
+    distance /= np.sqrt(img_shape[0] ** 2 + img_shape[1] ** 2)
+    size_difference /= img_shape[0] * img_shape[1]
+
+    return (weights[0] * distance
+            + weights[1] * size_difference
+            + weights[2] * (1 - iou)
+            + weights[3] * (1 - avg_histo_similarity)) / len(weights)
+
+
+def hungarianMatching(curBoxes, img_shape, curHistos, tracks: TrackStore, weights, gate=None, cascadeIou=None,
+                      stats: dict[str, int] = None, gateIou=None) -> tuple[
+    ndarray[int], ndarray[int], list[int], ndarray[float]]:
+    """ Matches the current boxes to the live tracks using the hungarian algorithm
 
     :param curBoxes: All boxes in the current frame
-    :param curFrame: Current frame
+    :param img_shape: The shape of the current frame
     :param curHistos: Histograms of the current frames (all boxes)
-    :param curFrameCount: Current frame count
-    :param history: History of all boxes
+    :param tracks: All live tracks (expired tracks must already be pruned)
     :param weights: Weights for the hungarian algorithm
-    :param MAX_AGE: Maximum age of a box before ignoring it
-    :return: Indexes of the matched boxes and the used score_matrix
+    :param gate: If not None (> 0), only pairs whose centers are closer than gate (in percent of the image diagonal)
+     can be matched. The remaining pairs are split into independent clusters which are matched separately
+    :param cascadeIou: If not None (0 < cascadeIou <= 1), pairs which are each other's best match with an
+     iou >= cascadeIou are accepted directly (with score 0, so always accepted by the score threshold); only the
+     remaining tracks and boxes are scored and matched by the hungarian algorithm
+    :param stats: Optional dict; the number of matches proposed by each stage is added to 'cascade' and 'hungarian'
+     (before any score threshold of the caller) and the number of scored (track, box) pairs to 'scored'
+    :param gateIou: If not None, only pairs with an iou >= gateIou (0 < gateIou <= 1) can be matched;
+     can be combined with gate (both have to pass) and is split into clusters the same way
+    :return: Rows and columns of the matches, the track id of every row and the score of every match
+    """
+    if gate is not None and gate <= 0:
+        raise ValueError(f'gate must be > 0 (percent of the image diagonal), got {gate}')
+    if gateIou is not None and not 0 < gateIou <= 1:
+        raise ValueError(f'gateIou must be in (0, 1], got {gateIou}')
+    if cascadeIou is not None and not 0 < cascadeIou <= 1:
+        # the cascade pairs are accepted without scoring, so they have to overlap
+        raise ValueError(f'cascadeIou must be in (0, 1], got {cascadeIou}')
+    track_ids = tracks.ids
+    track_boxes = BoundingBoxArray.fromBoxes(tracks.boxes)
+    det_boxes = BoundingBoxArray.fromBoxes(curBoxes)
+    track_models = tracks.models
+
+    cascade_rows = cascade_cols = np.empty(0, dtype=np.int64)
+    if cascadeIou is not None and len(track_boxes) > 0 and len(det_boxes) > 0:
+        cascade_rows, cascade_cols = mutualBestMatches(
+            BoundingBoxArray.intersectionOverUnion(track_boxes, det_boxes), cascadeIou)
+    if len(cascade_rows) > 0:
+        left_rows = np.setdiff1d(np.arange(len(track_boxes)), cascade_rows)
+        left_cols = np.setdiff1d(np.arange(len(det_boxes)), cascade_cols)
+        row_ind, col_ind, scores = _assignment(track_boxes[left_rows], [track_models[i] for i in left_rows],
+                                               det_boxes[left_cols], [curHistos[j] for j in left_cols],
+                                               img_shape, weights, gate, stats, gateIou)
+        hungarian_count = len(row_ind)
+        row_ind = np.concatenate((cascade_rows, left_rows[row_ind]))
+        col_ind = np.concatenate((cascade_cols, left_cols[col_ind]))
+        scores = np.concatenate((np.zeros(len(cascade_rows)), scores))
+        order = np.argsort(row_ind)
+        row_ind, col_ind, scores = row_ind[order], col_ind[order], scores[order]
+    else:
+        row_ind, col_ind, scores = _assignment(track_boxes, track_models, det_boxes, curHistos, img_shape, weights,
+                                               gate, stats, gateIou)
+        hungarian_count = len(row_ind)
+
+    if stats is not None:
+        stats['cascade'] = stats.get('cascade', 0) + len(cascade_rows)
+        stats['hungarian'] = stats.get('hungarian', 0) + hungarian_count
+    return row_ind, col_ind, track_ids, scores
+
+
+def mutualBestMatches(iou: ndarray, threshold: float) -> tuple[ndarray[int], ndarray[int]]:
+    """ Finds all pairs which are each other's best match with an iou >= threshold
+
+    :param iou: (t, d) matrix of the iou of every pair
+    :param threshold: min iou of a pair
+    :return: Rows and columns of the pairs
+    """
+    best_cols = iou.argmax(axis=1)
+    best_rows = iou.argmax(axis=0)
+    rows = np.arange(len(iou))
+    mutual = (best_rows[best_cols] == rows) & (iou[rows, best_cols] >= threshold)
+    return rows[mutual], best_cols[mutual]
+
+
+def _assignment(trackBoxes: BoundingBoxArray, trackModels: list[AppearanceModel], detBoxes: BoundingBoxArray,
+                detHistos: list[ndarray], img_shape: tuple, weights, gate=None, stats: dict[str, int] = None,
+                gateIou=None) -> tuple[ndarray[int], ndarray[int], ndarray[float]]:
+    """ Scores (see similarityMatrix) and matches the tracks and detections (see hungarianMatching)
+
+    :return: Rows and columns of the matches and their scores
+    """
+    def score(r, c):
+        if stats is not None:
+            stats['scored'] = stats.get('scored', 0) + len(r) * len(c)
+        return similarityMatrix(trackBoxes[r], [trackModels[i] for i in r], detBoxes[c], [detHistos[j] for j in c],
+                                img_shape, weights)
+
+    if gate is None and gateIou is None:
+        if stats is not None:
+            stats['scored'] = stats.get('scored', 0) + len(trackBoxes) * len(detBoxes)
+        score_matrix = similarityMatrix(trackBoxes, trackModels, detBoxes, detHistos, img_shape, weights)
+        # actual calculation of the hungarian algorithm (rectangular, so unmatched boxes simply get no row)
+        row_ind, col_ind = linear_sum_assignment(score_matrix)
+        return row_ind, col_ind, score_matrix[row_ind, col_ind]
+
+    if gate is not None:
+        radius = gate * np.sqrt(img_shape[0] ** 2 + img_shape[1] ** 2)
+        rows, cols = radiusPairs(np.stack((trackBoxes.center_x, trackBoxes.center_y), axis=1),
+                                 np.stack((detBoxes.center_x, detBoxes.center_y), axis=1), radius)
+        if gateIou is not None:
+            keep = BoundingBoxArray.elementwiseIntersectionOverUnion(trackBoxes[rows], detBoxes[cols]) >= gateIou
+            rows, cols = rows[keep], cols[keep]
+    else:
+        # the iou of all pairs is cheap compared to their scores (histogram correlation)
+        rows, cols = np.nonzero(BoundingBoxArray.intersectionOverUnion(trackBoxes, detBoxes) >= gateIou)
+    return _componentAssignment(rows, cols, len(trackBoxes), len(detBoxes), score)
+
+
+def _componentAssignment(rows: ndarray, cols: ndarray, n: int, m: int, scoreFunc) -> tuple[
+    ndarray[int], ndarray[int], ndarray[float]]:
+    """ Solves the assignment problem of a sparse bipartite graph. Every connected component
+    is solved on its own, so the cost is cubic in the size of the largest component instead of n + m
+
+    :param rows: left node of every allowed pair
+    :param cols: right node of every allowed pair
+    :param n: number of left nodes
+    :param m: number of right nodes
+    :param scoreFunc: function(rows, cols) returning the dense score matrix of a component
+    :return: Rows and columns of the matches and their scores
     """
-    size = max(len(curBoxes), len(history))
-    score_matrix = np.ones((size, size))
-    for (key_history, item_history) in history.items():
-        for j_det, (box, det_histo) in enumerate(zip(curBoxes, curHistos)):
-            if item_history[0].frame < curFrameCount - MAX_AGE:  # max age of n frames
-                score_matrix[key_history - 1, j_det] = 100000000
-                continue
-            score_matrix[key_history - 1, j_det] = item_history[0] \
-                .similarity(box, det_histo, item_history[1], curFrame.shape, weights)
-    # actual calculation of the hungarian algorithm
-    row_ind, col_ind = linear_sum_assignment(score_matrix)
-    return col_ind, row_ind, score_matrix
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    graph = coo_matrix((np.ones(len(rows), dtype=bool), (rows, n + cols)), shape=(n + m, n + m))
+    _, labels = connected_components(graph, directed=False)
+
+    # groups the pairs by component
+    edge_labels = labels[rows]
+    order = np.argsort(edge_labels, kind='stable')
+    splits = np.flatnonzero(np.diff(edge_labels[order])) + 1
+
+    row_ind, col_ind, scores = [], [], []
+    for edges in np.split(order, splits):
+        block_rows, local_rows = np.unique(rows[edges], return_inverse=True)
+        block_cols, local_cols = np.unique(cols[edges], return_inverse=True)
+        allowed = np.zeros((len(block_rows), len(block_cols)), dtype=bool)
+        allowed[local_rows, local_cols] = True
+        block = scoreFunc(block_rows, block_cols)
+        # pairs outside the gate are only used if the solver is forced to (and dropped afterwards)
+        cost = np.where(allowed, block, GATE_COST)
+        r, c = linear_sum_assignment(cost)
+        valid = allowed[r, c]
+        row_ind.append(block_rows[r[valid]])
+        col_ind.append(block_cols[c[valid]])
+        scores.append(block[r[valid], c[valid]])
+
+    row_ind, col_ind, scores = np.concatenate(row_ind), np.concatenate(col_ind), np.concatenate(scores)
+    order = np.argsort(row_ind)
+    return row_ind[order], col_ind[order], scores[order]
 
 
 def borderFilter(avgNewBoxSizeMultiplier, borderWidth, det_boxes_in_frame, frame, frame_counter, history) -> None:
@@ -2,6 +2,7 @@ import cv2 as cv
 import numpy as np
 
 from cv.utils.BoundingBox import BoundingBox
+from cv.utils.spatial import radiusPairs
 
 
 def checkForSuddenFlowChange(good_new, good_old, threshold=180):
@@ -23,12 +24,82 @@ def getHisto(gt_img, mask=None, binSize=None):
 
 
 def getHistosFromImgWithBBs(img: np.ndarray, bbs: list[BoundingBox], mask=None, binSize=None):
+    if mask is None:
+        return getHistosBatched(img, bbs, binSize)
     histos = []
     for bb in bbs:
         histos.append(getHisto(img[round(bb.top):round(bb.bottom), round(bb.left):round(bb.right)], mask, binSize))
     return histos
 
 
+def getHistosBatched(img: np.ndarray, bbs: list[BoundingBox], binSize=None) -> list[np.ndarray]:
+    """ Same histograms as getHisto for every box, but the frame (only the part covered by boxes) is converted
+    to HSV once and every histogram is counted from views into the shared HSV image
+
+    :param img: BGR image
+    :param bbs: boxes in the image
+    :param binSize: bin sizes of the histogram
+    :return: list of histograms
+    """
+    if binSize is None:
+        binSize = [180, 256]
+    if not bbs:
+        return []
+    crops = np.array([(round(bb.top), round(bb.bottom), round(bb.left), round(bb.right)) for bb in bbs])
+    crops[:, :2] = np.clip(crops[:, :2], 0, img.shape[0])
+    crops[:, 2:] = np.clip(crops[:, 2:], 0, img.shape[1])
+    top, bottom = crops[:, 0].min(), max(crops[:, 1].max(), crops[:, 0].min() + 1)
+    left, right = crops[:, 2].min(), max(crops[:, 3].max(), crops[:, 2].min() + 1)
+    crop_areas = np.maximum(crops[:, 1] - crops[:, 0], 0) * np.maximum(crops[:, 3] - crops[:, 2], 0)
+    if crop_areas.sum() < (bottom - top) * (right - left):
+        # boxes are sparse; converting every crop on its own touches fewer pixels than the shared region
+        return [getHisto(img[round(bb.top):round(bb.bottom), round(bb.left):round(bb.right)], None, binSize)
+                for bb in bbs]
+    hsv = cv.cvtColor(img[top:bottom, left:right], cv.COLOR_BGR2HSV)
+    histos = []
+    for crop_top, crop_bottom, crop_left, crop_right in crops - [top, top, left, left]:
+        crop = hsv[crop_top:crop_bottom, crop_left:crop_right]
+        if crop.size == 0:
+            roi_hist = np.zeros(binSize, dtype=np.float32)
+        else:
+            # calcHist quantizes the 8 bit values with its own lookup table, no need for a per pixel pass
+            roi_hist = cv.calcHist([crop], [0, 1], None, binSize, [0, 360, 0, 256])
+        cv.normalize(roi_hist, roi_hist, 0, 255, cv.NORM_MINMAX)
+        histos.append(roi_hist)
+    return histos
+
+
+def normalizeHistos(histos: list[np.ndarray] | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Flattens, centers and scales histograms to unit length, so that the correlation of two
+    histograms (cv.HISTCMP_CORREL) is a single dot product
+
+    :param histos: list of histograms (all with the same bin sizes)
+    :return: normalized histograms (n, bins) and a mask of the constant histograms (n,), which are all zero
+    """
+    flat = np.asarray(histos, dtype=np.float64).reshape(len(histos), -1)
+    centered = flat - flat.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum('ij,ij->i', centered, centered))
+    # opencv returns a correlation of 1 if one of the histograms is constant
+    constant = norms <= np.finfo(np.float64).eps
+    centered[constant] = 0
+    centered[~constant] /= norms[~constant, None]
+    return centered, constant
+
+
+def compareHistos(histosA: list[np.ndarray] | np.ndarray, histosB: list[np.ndarray] | np.ndarray) -> np.ndarray:
+    """ Vectorized version of cv.compareHist(a, b, cv.HISTCMP_CORREL) for every pair of histograms
+
+    :param histosA: first list of histograms (n)
+    :param histosB: second list of histograms (m)
+    :return: (n, m) matrix of correlations
+    """
+    normalizedA, constantA = normalizeHistos(histosA)
+    normalizedB, constantB = normalizeHistos(histosB)
+    correlations = normalizedA @ normalizedB.T
+    correlations[constantA[:, None] | constantB[None, :]] = 1
+    return correlations
+
+
 def opticalFlow(prevImg, frame_gray, points, flowSize=21, flowLevel=3):
     p1, st, err = cv.calcOpticalFlowPyrLK(prevImg, frame_gray, points, None, None, None,
                                           (flowSize, flowSize), flowLevel,
@@ -45,21 +116,75 @@ def failTracking(reason: str, scoresList, videoId: int, curIndex: int, gt_boxes:
 
 def filterPoints(points: np.ndarray, n: int, radius: int = 10) -> np.ndarray:
     """
-    Filters points that have less than n neighbors in a radius of r
+    Filters points that have less than n neighbors in a radius of r (the point itself counts as a neighbor)
     :param points: points to filter
     :param n: number of neighbors
     :param radius: search radius
-    :return: filtered points
+    :return: filtered points (empty 1d array if no point is left)
+    """
+    points = np.asarray(points)
+    if len(points) == 0:
+        return np.array([])
+    keep = _neighborCounts(points.reshape(len(points), -1), radius) >= n
+    if not keep.any():
+        return np.array([])
+    return points[keep]
+
+
+def filterPointsBatched(pointsList: list[np.ndarray | None], n: int, radius: int = 10) -> list[np.ndarray]:
+    """
+    Filters the points of many boxes in one call, same as [filterPoints(points, n, radius) for points in pointsList]
+    (neighbors are only counted within the points of the same box)
+    :param pointsList: points of every box (None = no points, like goodFeaturesToTrack without corners)
+    :param n: number of neighbors
+    :param radius: search radius
+    :return: filtered points of every box
+    """
+    pointsList = [np.asarray(points) if points is not None else np.empty((0, 2)) for points in pointsList]
+    sizes = [len(points) for points in pointsList]
+    flat = [points.reshape(len(points), -1) for points in pointsList if len(points) > 0]
+    if not flat or len({points.shape[1] for points in flat}) > 1:  # no points or mixed dimensions
+        return [filterPoints(points, n, radius) if len(points) > 0 else np.array([]) for points in pointsList]
+    groups = np.repeat(np.arange(len(pointsList)), sizes)
+    keep = _neighborCounts(np.concatenate(flat), radius, groups) >= n
+
+    filtered = []
+    for points, start, stop in zip(pointsList, np.cumsum(sizes) - sizes, np.cumsum(sizes)):
+        keep_box = keep[start:stop]
+        filtered.append(points[keep_box] if keep_box.any() else np.array([]))
+    return filtered
+
+
+def _neighborCounts(points: np.ndarray, radius: float, groups: np.ndarray | None = None,
+                    blockSize: int = 1024) -> np.ndarray:
+    """
+    Counts the points closer than radius to every point (including itself), only within the same group
+    2d points use a grid hash (radiusPairs), other dimensions blocked pairwise distances
+    :param points: (n, d) points
+    :param radius: search radius
+    :param groups: (n,) group of every point (None = one group)
+    :param blockSize: number of rows of a block of the pairwise distances
+    :return: (n,) number of neighbors
     """
-    filtered_points = []
-    for point in points:
-        neighbors = 0
-        for other_point in points:
-            if np.linalg.norm(point - other_point) < radius:
-                neighbors += 1
-        if neighbors >= n:
-            filtered_points.append(point)
-    return np.array(filtered_points)
+    points = points.astype(np.float64)
+    if len(points) == 0 or radius <= 0:  # nothing is closer than 0
+        return np.zeros(len(points), dtype=np.int64)
+    if points.shape[1] == 2:
+        if groups is not None:
+            # moves every group next to the previous one (gap > radius), so points of different groups never pair up
+            # (the coordinates are exact in float64, so the distances within a group do not change)
+            points[:, 0] += groups * (np.ptp(points[:, 0]) + 2 * radius)
+        rows, _ = radiusPairs(points, points, radius, strict=True)
+        return np.bincount(rows, minlength=len(points))
+
+    counts = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), blockSize):
+        block = points[start:start + blockSize]
+        close = np.sum((block[:, None, :] - points[None, :, :]) ** 2, axis=2) < radius ** 2
+        if groups is not None:
+            close &= groups[start:start + blockSize, None] == groups[None, :]
+        counts[start:start + blockSize] = close.sum(axis=1)
+    return counts
 
 
 def backProjection(histogram: np.ndarray, img: np.ndarray, bg: np.ndarray | None):
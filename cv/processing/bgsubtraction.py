@@ -1,136 +1,118 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import cv2 as cv
 import numpy as np
 
-from cv.utils.fileHandler import createOutFolder
+from cv.processing.maskCache import PACKED_EXTENSION, PackedMaskReader, PackedMaskWriter
+from cv.utils.CacheManager import CacheManager
+
+# cache of all masks; the max size of the cache is cacheManager.budget (bytes, None = unlimited), which can be changed
+# at any time (e.g. bgsubtraction.cacheManager.budget = 5 * 1024 ** 3), the least recently used masks are deleted
+cacheManager = CacheManager('out/cache/', 20 * 1024 ** 3)
 
 
 def opencvBGSubMOG2(video: cv.VideoCapture, videoId: int, fps: int = 30, genNewCache: bool = False,
                     **kwargs) -> cv.VideoCapture:
-    cached_video, cacheName, cachePath = loadCache("MOG2", videoId, genNewCache, kwargs)
-    if cached_video is not None:
-        return cached_video
-
-    backsub = cv.createBackgroundSubtractorMOG2(
-        kwargs.get('history', None),
-        kwargs.get('varThreshold', 16),
-        kwargs.get('detectShadows', False)
-    )
-
-    masks = []
-    video.set(cv.CAP_PROP_POS_FRAMES, 0)
-    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (kwargs.get("kernelSize", 5), kwargs.get("kernelSize", 5)))
-    while video.isOpened():
-        ret, frame = video.read()
-        if not ret:
-            break
-
-        fgMask = backsub.apply(frame, learningRate=kwargs.get('learningRate', -1))
-
-        fgMask = cv.morphologyEx(fgMask, cv.MORPH_OPEN, kernel)
-
-        # Prepare the image for matching
-        if kwargs.get('prepareMatching', False):
-            prepareMatching(fgMask)
-
-        # remove shadows (all gray to black)
-        fgMask[fgMask == 127] = 255
-
-        masks.append(cv.cvtColor(fgMask, cv.COLOR_GRAY2BGR))
-
-        if kwargs.get('display', False) and not showVideoFrameWithMask(frame, fgMask, fps):
-            break
-
-    # saves video file
-    createCache(cacheName, cachePath, masks, videoId)
-
-    # load video to return
-    video = cv.VideoCapture(cachePath)
-    return video
+    return runSubtractor("MOG2", video, videoId, fps, genNewCache, kwargs)
 
 
 def createCache(cacheName, cachePath, data, videoId):
-    createOutFolder('cache')
-    createOutFolder(f'cache/{videoId}')
-    if os.path.isfile(cachePath):
-        print("Overwriting Cache with name: " + cacheName, end="")
-        os.remove(cachePath)
-    else:
-        print("Creating Cache with name: " + cacheName, end="")
-    # Create video
-    writer = cv.VideoWriter(cachePath, cv.VideoWriter_fourcc(*'FFV1'), 30, (data[0].shape[1], data[0].shape[0]))
-    ten_th = len(data) // 10
-    for i, mask in enumerate(data):
+    writer = createCacheWriter(cacheName, cachePath, frameCount=len(data))
+    for mask in data:
         writer.write(mask)
-        if i % ten_th == 0:
-            print("-", end="")
     writer.release()
-    if not os.path.isfile(cachePath):
-        raise Exception("Cache file could not be created at Path: " + cachePath)
-    print("> Done")
-
-
-# returns video
-def opencvBGSubKNN(video: cv.VideoCapture, videoId: int, fps: int = 30, genNewCache: bool = False,
-                   **kwargs) -> cv.VideoCapture:
-    cached_video, cacheName, cachePath = loadCache("KNN", videoId, genNewCache, kwargs)
-    if cached_video is not None:
-        return cached_video
 
-    backsub = cv.createBackgroundSubtractorKNN(
-        kwargs.get('history', None),
-        kwargs.get('dist2Threshold', 400),
-        kwargs.get('detectShadows', False)
-    )
 
-    masks = []
-    video.set(cv.CAP_PROP_POS_FRAMES, 0)
-    kernel_open = cv.getStructuringElement(cv.MORPH_ELLIPSE,
-                                           (kwargs.get("kernelSize_open", 5), kwargs.get("kernelSize_open", 5)))
-    kernel_close = cv.getStructuringElement(cv.MORPH_ELLIPSE,
-                                            (kwargs.get("kernelSize_close", 5), kwargs.get("kernelSize_close", 5)))
-    while video.isOpened():
-        ret, frame = video.read()
-        if not ret:
-            break
+class MaskWriter:
+    def __init__(self, cacheName: str, cachePath: str, fps: int = 30, frameCount: int = 0, printInfo: bool = True):
+        """ Writes the masks of a background subtraction to a (single channel) cache video as they are produced,
+        so no mask has to be kept in memory. The file is opened with the first mask (its shape is not known before)
+        and only moved to cachePath by release, so an aborted run never leaves an incomplete cache
+
+        :param cacheName: name of the cache (only used for the progress output)
+        :param cachePath: path of the cache file
+        :param fps: fps of the cache video
+        :param frameCount: expected number of masks (only used for the progress output)
+        :param printInfo: If True, prints the progress
+        """
+        self.cacheName = cacheName
+        self.cachePath = cachePath
+        self.fps = fps
+        self.frameCount = frameCount
+        self.printInfo = printInfo
+        self.count = 0
+        self.__tmpPath = cachePath + '.tmp.avi'
+        self.__writer = None
+
+    def write(self, mask: np.ndarray) -> None:
+        """ Appends a mask to the cache video
+
+        :param mask: single channel (or BGR) mask
+        """
+        if mask.ndim == 3:
+            mask = cv.cvtColor(mask, cv.COLOR_BGR2GRAY)
+        if self.__writer is None:
+            os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+            if self.printInfo:
+                if os.path.isfile(self.cachePath):
+                    print("Overwriting Cache with name: " + self.cacheName, end="")
+                else:
+                    print("Creating Cache with name: " + self.cacheName, end="")
+            self.__writer = cv.VideoWriter(self.__tmpPath, cv.VideoWriter_fourcc(*'FFV1'), self.fps,
+                                           (mask.shape[1], mask.shape[0]), isColor=False)
+        self.__writer.write(mask)
+        if self.printInfo and self.count % max(self.frameCount // 10, 1) == 0:
+            print("-", end="")
+        self.count += 1
 
-        fgMask = backsub.apply(frame, learningRate=kwargs.get('learningRate', -1))
+    def release(self) -> None:
+        """ Closes the cache video and moves it to the cache path """
+        if self.__writer is None:
+            raise Exception("Cache file could not be created at Path: " + self.cachePath + " (no masks)")
+        self.__writer.release()
+        self.__writer = None
+        if not os.path.isfile(self.__tmpPath):
+            raise Exception("Cache file could not be created at Path: " + self.cachePath)
+        os.replace(self.__tmpPath, self.cachePath)
+        if self.printInfo:
+            print("> Done")
 
-        fgMask = cv.morphologyEx(fgMask, cv.MORPH_OPEN, kernel_open)
-        fgMask = cv.morphologyEx(fgMask, cv.MORPH_CLOSE, kernel_close)
 
-        # Prepare the image for matching
-        if kwargs.get('prepareMatching', False):
-            prepareMatching(fgMask)
+# returns video
+def opencvBGSubKNN(video: cv.VideoCapture, videoId: int, fps: int = 30, genNewCache: bool = False,
+                   **kwargs) -> cv.VideoCapture:
+    return runSubtractor("KNN", video, videoId, fps, genNewCache, kwargs)
 
-        # cv.imshow("fgMask", fgMask)
-        # cv.waitKey(25)
 
-        masks.append(cv.cvtColor(fgMask, cv.COLOR_GRAY2BGR))
-        if kwargs.get('display', False) and not showVideoFrameWithMask(frame, fgMask, fps):
-            break
+def createCacheWriter(cacheName: str, cachePath: str, fps: int = 30, frameCount: int = 0, printInfo: bool = True):
+    """ Returns the writer of the cache backend of the path (see loadCache) """
+    if cachePath.endswith(PACKED_EXTENSION):
+        return PackedMaskWriter(cacheName, cachePath, fps, frameCount, printInfo)
+    return MaskWriter(cacheName, cachePath, fps, frameCount, printInfo)
 
-    # saves video file
-    createCache(cacheName, cachePath, masks, videoId)
 
-    # load video to return
-    video = cv.VideoCapture(cachePath)
-    return video
+def openCache(cachePath: str) -> cv.VideoCapture | PackedMaskReader:
+    """ Opens a cache; FFV1 videos as cv.VideoCapture, bit-packed masks as PackedMaskReader """
+    if cachePath.endswith(PACKED_EXTENSION):
+        return PackedMaskReader(cachePath)
+    return cv.VideoCapture(cachePath)
 
 
-def loadCache(func_name: str, videoId: int, genNewCache: bool, kwargs: dict):
+def loadCache(func_name: str, videoId: int, genNewCache: bool, kwargs: dict, video: cv.VideoCapture = None):
     kwargs.pop('display', None)
     kwargs.pop('genNewCache', None)
-    kwargs_str = str(kwargs).replace(" ", "_").replace(":", "_").replace(",", "_").replace("=", "_").replace("{", "_") \
-        .replace("}", "_").replace("'", "").replace("_", "")
-    cacheName = f'{func_name}__{kwargs_str}.avi'
-    cachePath = os.path.join(f'out/cache/{videoId}/{cacheName}')
+    # 'avi' (FFV1 video) or 'packed' (bit-packed, memory-mapped masks; see maskCache)
+    extension = PACKED_EXTENSION if kwargs.pop('backend', 'avi') == 'packed' else '.avi'
+    # name is based on a hash of the algorithm, the parameters and the video (see CacheManager)
+    cachePath = cacheManager.entryPath(func_name, kwargs, video, videoId, extension)
+    cacheName = os.path.basename(cachePath)
     if not genNewCache:
-        # checks if file exists name is based on the parameters
-        if os.path.isfile(cachePath):
+        # checks if file exists
+        if cacheManager.lookup(cachePath):
             # loads video file and returns it
-            video = cv.VideoCapture(cachePath)
+            video = openCache(cachePath)
             return video, cacheName, cachePath
         else:
             print("Cache file not found at Path: " + cachePath)
@@ -140,26 +122,191 @@ def loadCache(func_name: str, videoId: int, genNewCache: bool, kwargs: dict):
 
 def ownBGSubMedian(video: cv.VideoCapture, videoId: int, fps: int = 30, genNewCache: bool = False,
                    **kwargs) -> cv.VideoCapture:
-    cached_video, cacheName, cachePath = loadCache("Median", videoId, genNewCache, kwargs)
+    return runSubtractor("Median", video, videoId, fps, genNewCache, kwargs)
+
+
+def runSubtractor(algorithm: str, video: cv.VideoCapture, videoId: int, fps: int, genNewCache: bool,
+                  kwargs: dict) -> cv.VideoCapture:
+    """ Runs a background subtraction (see createSubtractor) over the whole video and writes the masks to the cache
+
+    :param algorithm: MOG2, KNN or Median
+    :param video: The video
+    :param videoId: id of the video (folder of the cache)
+    :param fps: The fps of the video
+    :param genNewCache: If True, the cache is recreated even if it exists
+    :param kwargs: parameters of the algorithm
+    :return: Returns the cached masks
+    """
+    cached_video, cacheName, cachePath = loadCache(algorithm, videoId, genNewCache, kwargs, video)
     if cached_video is not None:
         return cached_video
 
-    frames = []
+    step = createSubtractor(algorithm, **kwargs)
+    writer = createCacheWriter(cacheName, cachePath, fps=fps,
+                               frameCount=int(video.get(cv.CAP_PROP_FRAME_COUNT)) - minWarmup(algorithm, kwargs))
     video.set(cv.CAP_PROP_POS_FRAMES, 0)
-    for _ in range(kwargs.get('n', 10)):
+    while video.isOpened():
         ret, frame = video.read()
         if not ret:
             break
-        frames.append(frame)
-    median = np.median(frames, axis=0).astype(np.uint8)
 
-    masks = []
-    video.set(cv.CAP_PROP_POS_FRAMES, kwargs.get('n', 10))
-    while video.isOpened():
-        ret, frame = video.read()
-        if not ret:
+        fgMask = step(frame)
+        if fgMask is None:  # still warming up
+            continue
+        writer.write(fgMask)
+
+        if kwargs.get('display', False) and not showVideoFrameWithMask(frame, fgMask, fps):
             break
 
+    # finishes the video file
+    writer.release()
+    cacheManager.register(cachePath)
+
+    # load video to return
+    video = openCache(cachePath)
+    return video
+
+
+def multiBGSub(video: cv.VideoCapture, videoId: int, configs: list[tuple[str, dict]], fps: int = 30,
+               genNewCache: bool = False) -> list[cv.VideoCapture | PackedMaskReader]:
+    """ Runs multiple background subtractions (e.g. a parameter study) with a single decode of the video.
+    Every frame is passed to all subtractors and every subtractor writes to its own cache entry.
+    Configs with an existing cache are loaded and not run again
+
+    :param video: The video
+    :param videoId: id of the video (folder of the caches)
+    :param configs: list of (algorithm, kwargs), e.g. [('MOG2', {'history': 200}), ('Median', {'n': 10})]
+    :param fps: The fps of the video
+    :param genNewCache: If True, all caches are recreated even if they exist
+    :return: Returns the cached masks of every config (same order)
+    """
+    results: list = [None] * len(configs)
+    running = []  # (index, step, writer, cachePath)
+    for i, (algorithm, kwargs) in enumerate(configs):
+        kwargs = dict(kwargs)
+        cached_video, cacheName, cachePath = loadCache(algorithm, videoId, genNewCache, kwargs, video)
+        if cached_video is not None:
+            results[i] = cached_video
+            continue
+        writer = createCacheWriter(cacheName, cachePath, fps=fps,
+                                   frameCount=int(video.get(cv.CAP_PROP_FRAME_COUNT)) - minWarmup(algorithm, kwargs))
+        running.append((i, createSubtractor(algorithm, **kwargs), writer, cachePath))
+
+    if running:
+        video.set(cv.CAP_PROP_POS_FRAMES, 0)
+        while video.isOpened():
+            ret, frame = video.read()
+            if not ret:
+                break
+            # the subtractors do not modify the frame, so all of them can use the same one
+            for _, step, writer, _ in running:
+                fgMask = step(frame)
+                if fgMask is not None:
+                    writer.write(fgMask)
+
+    for i, _, writer, cachePath in running:
+        writer.release()
+        cacheManager.register(cachePath)
+        results[i] = openCache(cachePath)
+    return results
+
+
+def minWarmup(algorithm: str, kwargs: dict) -> int:
+    """ Number of frames a subtractor needs before it returns the first mask """
+    return kwargs.get('n', 10) if algorithm == 'Median' else 0
+
+
+def createSubtractor(algorithm: str, **kwargs):
+    """ Creates the per frame step of a background subtraction
+
+    :param algorithm: MOG2, KNN or Median
+    :param kwargs: parameters of the algorithm
+    :return: Returns a function step(frame) -> mask, which has to be called with every frame in order.
+     It returns None while the model warms up (the first n frames of Median)
+    """
+    if algorithm == 'MOG2':
+        backsub = cv.createBackgroundSubtractorMOG2(
+            kwargs.get('history', None),
+            kwargs.get('varThreshold', 16),
+            kwargs.get('detectShadows', False)
+        )
+        kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE,
+                                          (kwargs.get("kernelSize", 5), kwargs.get("kernelSize", 5)))
+
+        def step(frame):
+            fgMask = backsub.apply(frame, learningRate=kwargs.get('learningRate', -1))
+
+            fgMask = cv.morphologyEx(fgMask, cv.MORPH_OPEN, kernel)
+
+            # Prepare the image for matching
+            if kwargs.get('prepareMatching', False):
+                prepareMatching(fgMask)
+
+            # remove shadows (all gray to black)
+            fgMask[fgMask == 127] = 255
+            return fgMask
+        return step
+
+    if algorithm == 'KNN':
+        backsub = cv.createBackgroundSubtractorKNN(
+            kwargs.get('history', None),
+            kwargs.get('dist2Threshold', 400),
+            kwargs.get('detectShadows', False)
+        )
+        kernel_open = cv.getStructuringElement(cv.MORPH_ELLIPSE,
+                                               (kwargs.get("kernelSize_open", 5), kwargs.get("kernelSize_open", 5)))
+        kernel_close = cv.getStructuringElement(cv.MORPH_ELLIPSE,
+                                                (kwargs.get("kernelSize_close", 5), kwargs.get("kernelSize_close", 5)))
+
+        def step(frame):
+            fgMask = backsub.apply(frame, learningRate=kwargs.get('learningRate', -1))
+
+            fgMask = cv.morphologyEx(fgMask, cv.MORPH_OPEN, kernel_open)
+            fgMask = cv.morphologyEx(fgMask, cv.MORPH_CLOSE, kernel_close)
+
+            # Prepare the image for matching
+            if kwargs.get('prepareMatching', False):
+                prepareMatching(fgMask)
+            return fgMask
+        return step
+
+    if algorithm != 'Median':
+        raise ValueError(f'Unknown algorithm: {algorithm}')
+
+    # static: median of the first n frames (never updated)
+    # sigmaDelta: approximate running median, moves every pixel 1 step towards the current frame (O(1) per frame)
+    # window: exact median of the last n frames (ring buffer of n frames, updated incrementally, see SlidingMedian)
+    mode = kwargs.get('mode', 'static')
+    if mode not in ('static', 'sigmaDelta', 'window'):
+        raise ValueError(f'Unknown median mode: {mode}')
+    n = kwargs.get('n', 10)
+    kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (5, 5))
+    frames = []
+    window = SlidingMedian(n) if mode == 'window' else None
+    median = None
+    count = 0
+
+    def step(frame):
+        nonlocal median, count
+        if count < n:
+            # the first n frames are only used to build the background
+            count += 1
+            if mode == 'static':
+                frames.append(frame)
+                if count == n:
+                    median = np.median(frames, axis=0).astype(np.uint8)
+                    frames.clear()
+            elif mode == 'sigmaDelta':
+                if median is None:
+                    median = frame.copy()
+                else:
+                    sigmaDeltaUpdate(median, frame)
+            else:
+                window.push(frame)
+                if count == n:
+                    median = window.median()
+            return None
+
         # Subtract the median from the current frame
         fgMask = cv.absdiff(frame, median)
 
@@ -169,23 +316,245 @@ def ownBGSubMedian(video: cv.VideoCapture, videoId: int, fps: int = 30, genNewCa
                               kwargs.get('thresholdMax', 255), cv.THRESH_BINARY)[1]
 
         # closing with circles
-        fgMask = cv.morphologyEx(fgMask, cv.MORPH_CLOSE, cv.getStructuringElement(cv.MORPH_ELLIPSE, (5, 5)))
+        fgMask = cv.morphologyEx(fgMask, cv.MORPH_CLOSE, kernel)
 
         # Prepare the image for matching
         if kwargs.get('prepareMatching', False):
             prepareMatching(fgMask)
 
-        masks.append(fgMask)
+        # update the background with the current frame (used for the next frame)
+        if mode == 'sigmaDelta':
+            sigmaDeltaUpdate(median, frame)
+        elif mode == 'window':
+            window.push(frame)
+            median = window.median()
+        return fgMask
+    return step
 
-        if kwargs.get('display', False) and not showVideoFrameWithMask(frame, fgMask, fps):
-            break
 
-    # saves video file
-    createCache(cacheName, cachePath, masks, videoId)
+def sigmaDeltaUpdate(background: np.ndarray, frame: np.ndarray) -> None:
+    """ Sigma-delta approximation of a running median: every pixel of the background moves by 1 towards the frame.
+    Updates the (uint8) background in place
 
-    # load video to return
-    video = cv.VideoCapture(cachePath)
-    return video
+    :param background: The background
+    :param frame: The current frame
+    """
+    background += frame > background
+    background -= frame < background
+
+
+class SlidingMedian:
+    TILE_BYTES = 64 * 1024 ** 2  # max size of the temporary arrays of the full calculation
+
+    def __init__(self, window: int):
+        """ Exact per pixel median of the last frames, kept in an uint8 ring buffer
+
+        Once the buffer is full, the median is updated incrementally: for the middle order statistic (two for an even
+        window) every pixel keeps its value and the number of buffered values below and equal to it. A new frame
+        replacing the oldest one changes these counts in O(1) per pixel and moves the order statistic by at most one
+        rank, so only the pixels whose median changes search the buffer for the next lower or higher value.
+        The cost per frame is O(pixels + window * changed pixels) instead of O(window * pixels) for a full median.
+        The full calculation (first median) runs in tiles of rows, bounded by TILE_BYTES
+
+        :param window: number of frames
+        """
+        self.window = window
+        self.buffer = None
+        self.count = 0
+        self.position = 0
+        self.__stats = None  # [rank, value, less, equal] of every middle order statistic (flat per pixel arrays)
+
+    def push(self, frame: np.ndarray) -> None:
+        """ Adds a frame (the oldest frame is overwritten if the buffer is full) """
+        if self.buffer is None:
+            self.buffer = np.empty((self.window, *frame.shape), dtype=np.uint8)
+        old = self.buffer[self.position].reshape(-1).copy() if self.__stats is not None else None
+        self.buffer[self.position] = frame
+        self.position = (self.position + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+        if old is not None:
+            self.__update(old, self.buffer[self.position - 1].reshape(-1))
+
+    def median(self) -> np.ndarray:
+        """ Returns the median of the frames in the buffer (uint8, same as np.median(...).astype(np.uint8)) """
+        if self.__stats is None:
+            lower, upper = self.__orderStatistics()
+            if self.count < self.window:  # not full yet, so no incremental update
+                return ((lower.astype(np.uint16) + upper) // 2).astype(np.uint8)
+            self.__initStats(lower, upper)
+        shape = self.buffer.shape[1:]
+        if len(self.__stats) == 1:
+            return self.__stats[0][1].reshape(shape).copy()
+        lower, upper = self.__stats[0][1], self.__stats[1][1]
+        return ((lower.astype(np.uint16) + upper) // 2).astype(np.uint8).reshape(shape)
+
+    def __orderStatistics(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Calculates the lower and upper middle order statistic of the buffered frames (in tiles of rows) """
+        frames = self.buffer[:self.count]
+        kth = sorted({(self.count - 1) // 2, self.count // 2})
+        lower = np.empty(frames.shape[1:], dtype=np.uint8)
+        upper = np.empty(frames.shape[1:], dtype=np.uint8)
+        rows = max(SlidingMedian.TILE_BYTES // (self.count * frames[0, 0].size), 1)  # np.partition copies the tile
+        for start in range(0, len(lower), rows):
+            tile = np.partition(frames[:, start:start + rows], kth, axis=0)
+            lower[start:start + rows] = tile[kth[0]]
+            upper[start:start + rows] = tile[kth[-1]]
+        return lower, upper
+
+    def __initStats(self, lower: np.ndarray, upper: np.ndarray) -> None:
+        flat = self.buffer.reshape(self.window, -1)
+        self.__stats = []
+        for rank, value in sorted({((self.window - 1) // 2, 0), (self.window // 2, 1)}):
+            value = (lower if value == 0 else upper).reshape(-1).copy()
+            less = np.zeros(len(value), dtype=np.uint16)
+            equal = np.zeros(len(value), dtype=np.uint16)
+            for frame in flat:
+                less += frame < value
+                equal += frame == value
+            self.__stats.append([rank, value, less, equal])
+
+    def __update(self, old: np.ndarray, new: np.ndarray) -> None:
+        """ Replaces the value old by new (flat frames) in the counts and moves the order statistics """
+        flat = self.buffer.reshape(self.window, -1)
+        for rank, value, less, equal in self.__stats:
+            less += new < value
+            less -= old < value
+            equal += new == value
+            equal -= old == value
+
+            # more than rank values below: the order statistic is the largest value below
+            down = np.flatnonzero(less > rank)
+            if len(down):
+                values = flat[:, down]
+                lower = np.where(values < value[down], values, 0).max(axis=0).astype(np.uint8)
+                count = np.count_nonzero(values == lower, axis=0).astype(np.uint16)
+                less[down] -= count
+                equal[down] = count
+                value[down] = lower
+
+            # at most rank values below or equal: the order statistic is the smallest value above
+            up = np.flatnonzero(less + equal <= rank)
+            if len(up):
+                values = flat[:, up]
+                higher = np.where(values > value[up], values, 255).min(axis=0).astype(np.uint8)
+                count = np.count_nonzero(values == higher, axis=0).astype(np.uint16)
+                less[up] += equal[up]
+                equal[up] = count
+                value[up] = higher
+
+
+def parallelBGSub(algorithm: str, videoPath: str, videoId: int, fps: int = 30, genNewCache: bool = False,
+                  chunkSize: int = 500, warmup: int = 100, workers: int = None, compare: bool = False,
+                  **kwargs) -> cv.VideoCapture | PackedMaskReader:
+    """ Runs a background subtraction in parallel: the video is split into chunks of frames, which are processed in
+    worker processes. Every chunk first feeds the warmup frames before it to its own subtractor, so the model can
+    converge before the first mask of the chunk. The masks of all chunks are stitched (in order) into one cache
+
+    :param algorithm: MOG2, KNN or Median
+    :param videoPath: path of the video
+    :param videoId: id of the video (folder of the cache)
+    :param fps: The fps of the video
+    :param genNewCache: If True, the cache is recreated even if it exists
+    :param chunkSize: number of frames of a chunk
+    :param warmup: number of frames before a chunk used to warm up the model (at least n for Median)
+    :param workers: number of worker processes (None = number of cpus)
+    :param compare: If True, also runs (or loads) the serial subtraction and prints how much the masks differ
+    :param kwargs: parameters of the algorithm (and backend, see loadCache)
+    :return: Returns the cached masks
+    """
+    backend = kwargs.pop('backend', 'avi')
+    kwargs.pop('display', None)
+    warmup = max(warmup, minWarmup(algorithm, kwargs))
+    video = cv.VideoCapture(videoPath)
+    frameCount = int(video.get(cv.CAP_PROP_FRAME_COUNT))
+    # the chunked masks differ from the serial ones, so the chunking is part of the cache key
+    cached_video, cacheName, cachePath = loadCache(algorithm, videoId, genNewCache,
+                                                   {**kwargs, 'backend': backend, 'chunkSize': chunkSize,
+                                                    'warmup': warmup}, video)
+    video.release()
+    if cached_video is None:
+        starts = list(range(0, frameCount, chunkSize))
+        extension = os.path.splitext(cachePath)[1]
+        chunkPaths = [f'{cachePath}.chunk{i}{extension}' for i in range(len(starts))]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(partial(_subtractChunk, algorithm, videoPath, chunkSize, warmup, kwargs),
+                                       starts, chunkPaths))
+        print(f'{cacheName}: {len(starts)} chunks with {sum(counts)} masks done, stitching them')
+
+        writer = createCacheWriter(cacheName, cachePath, fps=fps, frameCount=sum(counts))
+        for chunkPath, count in zip(chunkPaths, counts):
+            if count == 0:
+                continue
+            chunk = openCache(chunkPath)
+            for _ in range(count):
+                writer.write(chunk.read()[1])
+            chunk.release()
+            os.remove(chunkPath)
+        writer.release()
+        cacheManager.register(cachePath)
+        cached_video = openCache(cachePath)
+
+    if compare:
+        serial = runSubtractor(algorithm, cv.VideoCapture(videoPath), videoId, fps, False,
+                               {**kwargs, 'backend': backend})
+        difference = maskDifference(openCache(cachePath), serial)
+        # mask i belongs to frame i + minWarmup
+        frames = np.arange(len(difference)) + minWarmup(algorithm, kwargs)
+        print(f'{algorithm} chunked (chunkSize={chunkSize}, warmup={warmup}) vs serial: '
+              f'{difference.mean() * 100:.3f}% different pixels')
+        for i, start in enumerate(range(0, frameCount, chunkSize)):
+            in_chunk = difference[(frames >= start) & (frames < start + chunkSize)]
+            if len(in_chunk):
+                print(f'  Chunk {i + 1} (frames {start} - {start + chunkSize - 1}): {in_chunk.mean() * 100:.3f}% '
+                      f'(first frame {in_chunk[0] * 100:.3f}%, max {in_chunk.max() * 100:.3f}%)')
+    return cached_video
+
+
+def _subtractChunk(algorithm: str, videoPath: str, chunkSize: int, warmup: int, kwargs: dict, start: int,
+                   chunkPath: str) -> int:
+    """ Runs the subtraction of one chunk (in a worker process) and writes its masks to chunkPath
+
+    :return: Returns the number of masks of the chunk
+    """
+    video = cv.VideoCapture(videoPath)
+    first = max(start - warmup, 0)
+    video.set(cv.CAP_PROP_POS_FRAMES, first)
+    step = createSubtractor(algorithm, **kwargs)
+    # the chunks run in parallel, so their progress would interleave (parallelBGSub prints a summary)
+    writer = createCacheWriter(os.path.basename(chunkPath), chunkPath, frameCount=chunkSize, printInfo=False)
+    for index in range(first, start + chunkSize):
+        ret, frame = video.read()
+        if not ret:
+            break
+        fgMask = step(frame)
+        if index >= start and fgMask is not None:
+            writer.write(fgMask)
+    video.release()
+    if writer.count > 0:
+        writer.release()
+    return writer.count
+
+
+def maskDifference(masks1: cv.VideoCapture | PackedMaskReader,
+                   masks2: cv.VideoCapture | PackedMaskReader) -> np.ndarray:
+    """ Compares two mask sequences frame by frame
+
+    :param masks1: The first masks (opened cache)
+    :param masks2: The second masks (opened cache)
+    :return: Returns the share of different pixels of every frame
+    """
+    difference = []
+    while True:
+        ret1, mask1 = masks1.read()
+        ret2, mask2 = masks2.read()
+        if not ret1 or not ret2:
+            break
+        mask1 = mask1 if mask1.ndim == 2 else mask1[..., 0]
+        mask2 = mask2 if mask2.ndim == 2 else mask2[..., 0]
+        difference.append(np.count_nonzero(mask1 != mask2) / mask1.size)
+    masks1.release()
+    masks2.release()
+    return np.array(difference)
 
 
 def showVideoFrameWithMask(frame: np.ndarray, mask: np.ndarray, fps: int = 30):
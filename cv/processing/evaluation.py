@@ -1,6 +1,17 @@
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2 as cv
 import motmetrics as mm
 import numpy as np
+from numpy import ndarray
+
+from cv.processing.maskCache import PACKED_EXTENSION, PackedMaskReader
+from cv.utils.BoundingBoxArray import BoundingBoxArray
+from cv.utils.video import FramePrefetcher
+
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)  # set bits of every byte
+# set bits of every byte of an uint8 array (uint8 result, so no wider copy of the packed masks)
+popcount = getattr(np, 'bitwise_count', POPCOUNT.__getitem__)
 
 
 def matching(gtframe, maskframe):
@@ -25,6 +36,97 @@ def matching(gtframe, maskframe):
     return fs
 
 
+def evaluateSequence(gtPath: str, maskPath: str, offset: int = 0, chunkSize: int = 64) -> dict[str, ndarray | float]:
+    """ Evaluates all masks of a sequence at once (same values as matching for every frame)
+
+    The frames are bit-packed (gt: gray > 200, mask: > 127, like prepareMatching) and tp/fp/fn are counted with
+    boolean logic on chunks of packed frames, packed mask caches (see maskCache) are used without unpacking
+
+    :param gtPath: path of the ground truth video
+    :param maskPath: path of the masks (FFV1 video or packed mask cache)
+    :param offset: mask frame i belongs to gt frame i + offset (e.g. n of ownBGSubMedian)
+    :param chunkSize: number of frames counted at once
+    :return: per frame arrays ('tp', 'fp', 'fn', 'precision', 'recall', 'fscore'; fscore is 1 if the gt is empty)
+     and the aggregate values over all frames ('totalPrecision', 'totalRecall', 'totalFscore', 'meanFscore')
+    """
+    gt_video = FramePrefetcher(cv.VideoCapture(gtPath))
+    masks = PackedMaskReader(maskPath) if maskPath.endswith(PACKED_EXTENSION) else cv.VideoCapture(maskPath)
+    for _ in range(offset):
+        gt_video.read()
+
+    counts = []
+    gt_chunk, mask_chunk = [], []
+    frame = 0
+    while True:
+        ret, gt_frame = gt_video.read()
+        if ret and isinstance(masks, PackedMaskReader):
+            ret = frame < len(masks)
+            mask_row = masks.packed[frame] if ret else None
+        elif ret:
+            ret, mask_frame = masks.read()
+            mask_row = np.packbits(mask_frame[..., 0] > 127) if ret else None
+        if ret:
+            gt_chunk.append(np.packbits(cv.cvtColor(gt_frame, cv.COLOR_BGR2GRAY) > 200))
+            mask_chunk.append(mask_row)
+            frame += 1
+        if gt_chunk and (not ret or len(gt_chunk) == chunkSize):
+            counts.append(_countChunk(np.array(gt_chunk), np.array(mask_chunk)))
+            gt_chunk, mask_chunk = [], []
+        if not ret:
+            break
+    gt_video.release()
+    masks.release()
+
+    tp, fp, fn, gt_empty = np.concatenate(counts, axis=1) if counts else np.zeros((4, 0), dtype=np.int64)
+    result = {'tp': tp, 'fp': fp, 'fn': fn}
+    result['precision'], result['recall'], result['fscore'] = _scores(tp, fp, fn)
+    result['fscore'][gt_empty.astype(bool)] = 1
+    total_precision, total_recall, total_fscore = _scores(tp.sum(keepdims=True), fp.sum(keepdims=True),
+                                                          fn.sum(keepdims=True))
+    result['totalPrecision'] = float(total_precision[0])
+    result['totalRecall'] = float(total_recall[0])
+    result['totalFscore'] = float(total_fscore[0])
+    result['meanFscore'] = float(result['fscore'].mean()) if len(tp) else 0.0
+    return result
+
+
+def evaluateSequences(gtPaths: list[str], maskPaths: list[str], offsets: list[int] = None,
+                      workers: int = 1) -> list[dict[str, ndarray | float]]:
+    """ Evaluates multiple sequences (see evaluateSequence), in parallel processes if workers > 1
+
+    :param gtPaths: paths of the ground truth videos
+    :param maskPaths: paths of the masks
+    :param offsets: offset of every sequence (default 0)
+    :param workers: number of worker processes
+    :return: the results of every sequence (same order)
+    """
+    offsets = [0] * len(gtPaths) if offsets is None else offsets
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(evaluateSequence, gtPaths, maskPaths, offsets))
+    return list(map(evaluateSequence, gtPaths, maskPaths, offsets))
+
+
+def _countChunk(gt: ndarray, masks: ndarray) -> ndarray:
+    """ Counts tp, fp and fn of packed frames (n, bytes) and checks which gt frames are empty
+
+    :return: (4, n) array of tp, fp, fn and gt_empty
+    """
+    tp = popcount(gt & masks).sum(axis=1, dtype=np.int64)
+    fp = popcount(~gt & masks).sum(axis=1, dtype=np.int64)
+    fn = popcount(gt & ~masks).sum(axis=1, dtype=np.int64)
+    return np.stack((tp, fp, fn, ~gt.any(axis=1)))
+
+
+def _scores(tp: ndarray, fp: ndarray, fn: ndarray) -> tuple[ndarray, ndarray, ndarray]:
+    """ Vectorized precision, recall and fscore (0 if undefined) """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prec = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        rec = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        fs = np.where(prec + rec > 0, 2 * prec * rec / (prec + rec), 0.0)
+    return prec, rec, fs
+
+
 def precision(rp: int, fp: int) -> float:
     sigma = rp + fp
     if sigma == 0:
@@ -59,8 +161,38 @@ def evalMOTA(all_dects, all_gts, name='Default'):
             C = mm.distances.iou_matrix(gt[:, 2:], det[:, 2:], max_iou=0.5)
             acc.update(gt[:, 1].astype(int), det[:, 1].astype(int), C)
         accs.append(acc)
+    summarizeMOTA(accs, name)
+
+
+class StreamingMOTA:
+    def __init__(self, gt_boxes: BoundingBoxArray):
+        """ Accumulates the MOT metrics of one video while it is tracked, one frame at a time
+
+        :param gt_boxes: The ground truth boxes of the video (grouped by frame once by their frame index)
+        """
+        self.gt_boxes = gt_boxes
+        self.acc = mm.MOTAccumulator(auto_id=False)
+
+    def update(self, frame: int, ids: ndarray, boxes: ndarray) -> None:
+        """ Adds the tracker output of one frame to the accumulator
+
+        :param frame: The frame
+        :param ids: The track ids of the boxes (n)
+        :param boxes: The boxes (n, 4) as (left, top, width, height)
+        """
+        gt = self.gt_boxes.inFrame(frame)
+        C = mm.distances.iou_matrix(gt.getTuples(), np.asarray(boxes, dtype=float).reshape(-1, 4), max_iou=0.5)
+        self.acc.update(gt.box_id.astype(int), np.asarray(ids, dtype=int), C, frameid=frame)
+
+
+def summarizeMOTA(accs: list[mm.MOTAccumulator], name='Default'):
+    """ Computes and prints the MOT metrics of all videos and the average MOTA
+
+    :param accs: one accumulator per video
+    :param name: name of the run
+    """
     mh = mm.metrics.create()
-    names = [f'{name} -- Video {vid_i + 1}' for vid_i in range(len(all_dects))]
+    names = [f'{name} -- Video {vid_i + 1}' for vid_i in range(len(accs))]
     summary = mh.compute_many(accs,
                               metrics=mm.metrics.motchallenge_metrics,
                               names=names,
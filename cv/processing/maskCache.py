@@ -0,0 +1,133 @@
+import os
+
+import cv2 as cv
+import numpy as np
+from numpy import ndarray
+
+PACKED_EXTENSION = '.pmask'
+MAGIC = b'PMSK'
+# header of a packed mask file, the packed frames start at HEADER_SIZE (one row of ceil(height * width / 8) bytes each)
+HEADER = np.dtype([('magic', 'S4'), ('height', '<u4'), ('width', '<u4'), ('count', '<u4'), ('fps', '<f4')])
+HEADER_SIZE = 32
+
+
+class PackedMaskWriter:
+    def __init__(self, cacheName: str, cachePath: str, fps: int = 30, frameCount: int = 0, printInfo: bool = True):
+        """ Writes binary masks bit-packed (np.packbits) to a cache file, 1/8 of the size of raw uint8 masks.
+        Same usage as bgsubtraction.MaskWriter; pixels > 127 are foreground
+
+        :param cacheName: name of the cache (only used for the progress output)
+        :param cachePath: path of the cache file
+        :param fps: fps of the masks (saved in the header)
+        :param frameCount: expected number of masks (only used for the progress output)
+        :param printInfo: If True, prints the progress
+        """
+        self.cacheName = cacheName
+        self.cachePath = cachePath
+        self.fps = fps
+        self.frameCount = frameCount
+        self.printInfo = printInfo
+        self.count = 0
+        self.shape = None
+        self.__tmpPath = cachePath + '.tmp'
+        self.__file = None
+
+    def write(self, mask: ndarray) -> None:
+        """ Appends a mask to the cache
+
+        :param mask: single channel (or BGR) mask
+        """
+        if mask.ndim == 3:
+            mask = cv.cvtColor(mask, cv.COLOR_BGR2GRAY)
+        if self.__file is None:
+            os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+            if self.printInfo:
+                if os.path.isfile(self.cachePath):
+                    print("Overwriting Cache with name: " + self.cacheName, end="")
+                else:
+                    print("Creating Cache with name: " + self.cacheName, end="")
+            self.shape = mask.shape
+            self.__file = open(self.__tmpPath, 'wb')
+            self.__file.write(bytes(HEADER_SIZE))  # the header is written by release (count is not known yet)
+        elif mask.shape != self.shape:
+            raise ValueError(f'Mask shape {mask.shape} does not match the shape of the cache {self.shape}')
+        self.__file.write(np.packbits(mask > 127).tobytes())
+        if self.printInfo and self.count % max(self.frameCount // 10, 1) == 0:
+            print("-", end="")
+        self.count += 1
+
+    def release(self) -> None:
+        """ Writes the header, closes the file and moves it to the cache path """
+        if self.__file is None:
+            raise Exception("Cache file could not be created at Path: " + self.cachePath + " (no masks)")
+        header = np.array([(MAGIC, self.shape[0], self.shape[1], self.count, self.fps)], dtype=HEADER)
+        self.__file.seek(0)
+        self.__file.write(header.tobytes())
+        self.__file.close()
+        self.__file = None
+        os.replace(self.__tmpPath, self.cachePath)
+        if self.printInfo:
+            print("> Done")
+
+
+class PackedMaskReader:
+    def __init__(self, cachePath: str):
+        """ Reads a cache of PackedMaskWriter. The file is memory-mapped, so any frame can be accessed in O(1)
+        Can also be used like a cv.VideoCapture (read, set, get, isOpened, release), but returns single channel masks
+
+        :param cachePath: path of the cache file
+        """
+        self.cachePath = cachePath
+        header = np.fromfile(cachePath, dtype=HEADER, count=1)
+        if len(header) == 0 or header['magic'][0] != MAGIC:
+            raise ValueError(f'{cachePath} is not a packed mask file')
+        self.height = int(header['height'][0])
+        self.width = int(header['width'][0])
+        self.fps = float(header['fps'][0])
+        count = int(header['count'][0])
+        rowBytes = (self.height * self.width + 7) // 8
+        self.packed = np.memmap(cachePath, dtype=np.uint8, mode='r', offset=HEADER_SIZE, shape=(count, rowBytes)) \
+            if count > 0 else np.empty((0, rowBytes), dtype=np.uint8)
+        self.position = 0
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, frame: int) -> ndarray:
+        """ Returns the mask (0 or 255) of a frame (0 based) """
+        return self.frames(frame, frame + 1)[0] if frame >= 0 else self[len(self) + frame]
+
+    def frames(self, start: int, stop: int) -> ndarray:
+        """ Returns the masks (0 or 255) of the frames start ... stop - 1 (0 based) at once
+
+        :param start: first frame
+        :param stop: frame after the last frame
+        :return: (n, height, width) uint8 array
+        """
+        masks = np.unpackbits(self.packed[start:stop], axis=1, count=self.height * self.width)
+        masks *= 255
+        return masks.reshape(-1, self.height, self.width)
+
+    def read(self) -> tuple[bool, ndarray | None]:
+        """ Returns the next mask like cv.VideoCapture.read """
+        if self.position >= len(self):
+            return False, None
+        self.position += 1
+        return True, self[self.position - 1]
+
+    def set(self, propId: int, value) -> bool:
+        if propId != cv.CAP_PROP_POS_FRAMES:
+            return False
+        self.position = min(max(int(value), 0), len(self))
+        return True
+
+    def get(self, propId: int) -> float:
+        return {cv.CAP_PROP_POS_FRAMES: self.position, cv.CAP_PROP_FRAME_COUNT: len(self),
+                cv.CAP_PROP_FRAME_WIDTH: self.width, cv.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv.CAP_PROP_FPS: self.fps}.get(propId, 0)
+
+    def isOpened(self) -> bool:
+        return self.packed is not None
+
+    def release(self) -> None:
+        self.packed = None
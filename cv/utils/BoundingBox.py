@@ -54,11 +54,37 @@ class BoundingBox:
         if copy:
             img = img.copy()
 
+        if overrideOverlay is not None:
+            overlay = overrideOverlay
+        elif getOverlay or alpha != 1.0:
+            overlay = img.copy()
+        else:
+            overlay = img  # opaque box, so it can be drawn directly onto the image
+
+        self.draw(overlay, color, thickness, font_color, verbose)
+
+        if getOverlay:
+            return overlay
+
+        # adds overlay to image
+        if overlay is not img:
+            addWeighted(img, 1 - alpha, overlay, alpha, 0, img)
+
+        return img
+
+    def draw(self, img: ndarray, color: tuple[int, int, int] = (0, 255, 0), thickness: int = 2,
+             font_color: tuple[int, int, int] = (0, 0, 0), verbose: bool = False) -> None:
+        """ Draws the box with confidence and box_id as text directly onto the image (without copying it)
+
+        :param img: The image to draw on
+        :param color: The color of the box
+        :param thickness: The thickness of the box
+        :param font_color: The color of the text on the box
+        :param verbose: If True, the function will print warning if any value is not an integer
+        """
         # rounds all values to integers and prints warning if any value is not an integer
         left, top, right, bottom = self.__roundValues(verbose)
 
-        overlay = overrideOverlay if overrideOverlay is not None else img.copy()
-
         # draws confidence on top left corner of box outside
         if self.confidence is not None:
             text = f'{self.confidence:.2f}'
@@ -66,8 +92,8 @@ class BoundingBox:
             font_scale = 0.5
             line_type = 1
             text_width, text_height = getTextSize(text, font, font_scale, line_type)[0]
-            overlay = rectangle(overlay, (left, top), (left + text_width, top + text_height), color, -1)
-            overlay = putText(overlay, text, (left, top + text_height), font, font_scale, font_color, line_type)
+            rectangle(img, (left, top), (left + text_width, top + text_height), color, -1)
+            putText(img, text, (left, top + text_height), font, font_scale, font_color, line_type)
 
         # draws id to bottom right corner of box inside of the box
         if self.box_id is not None:
@@ -76,19 +102,11 @@ class BoundingBox:
             font_scale = 0.5
             line_type = 1
             text_width, text_height = getTextSize(text, font, font_scale, line_type)[0]
-            overlay = rectangle(overlay, (right - text_width, bottom - text_height), (right, bottom), color, -1)
-            overlay = putText(overlay, text, (right - text_width, bottom), font, font_scale, font_color, line_type)
+            rectangle(img, (right - text_width, bottom - text_height), (right, bottom), color, -1)
+            putText(img, text, (right - text_width, bottom), font, font_scale, font_color, line_type)
 
         # draws box
-        overlay = rectangle(overlay, (left, top), (right, bottom), color, thickness)
-
-        if getOverlay:
-            return overlay
-
-        # adds overlay to image
-        addWeighted(img, 1 - alpha, overlay, alpha, 0, img)
-
-        return img
+        rectangle(img, (left, top), (right, bottom), color, thickness)
 
     def __roundValues(self, verbose: bool = True):
         """ Rounds all values to integers and prints warning if any value is not an integer """
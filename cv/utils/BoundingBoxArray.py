@@ -0,0 +1,235 @@
+import numpy as np
+from numpy import ndarray
+
+from cv.utils.BoundingBox import BoundingBox
+
+
+class BoundingBoxArray:
+    COLUMNS = ('frame', 'box_id', 'left', 'top', 'width', 'height', 'confidence', 'class_id', 'visibility')
+
+    def __init__(self, frame, box_id, left, top, width, height, confidence=None, class_id=None, visibility=None):
+        """ A collection of bounding boxes stored as one array per attribute (struct of arrays)
+
+        Optional columns are None if no box has the value, missing values of a partially filled column are NaN.
+        Derived values (right, bottom, center, area) are computed on demand
+
+        :param frame: frame of every box
+        :param box_id: id of every box
+        :param left: left of every box (clipped to 0 like in BoundingBox)
+        :param top: top of every box (clipped to 0 like in BoundingBox)
+        :param width: width of every box
+        :param height: height of every box
+        :param confidence: confidence of every box (optional)
+        :param class_id: class of every box (optional)
+        :param visibility: visibility of every box (optional)
+        """
+        self.frame = np.asarray(frame)
+        self.box_id = np.asarray(box_id)
+        self.left = np.asarray(left)
+        self.top = np.asarray(top)
+        # only copies if there is something to clip, so slices stay views
+        if np.any(self.left < 0):
+            self.left = np.maximum(self.left, 0)
+        if np.any(self.top < 0):
+            self.top = np.maximum(self.top, 0)
+        self.width = np.asarray(width)
+        self.height = np.asarray(height)
+        self.confidence = None if confidence is None else np.asarray(confidence)
+        self.class_id = None if class_id is None else np.asarray(class_id)
+        self.visibility = None if visibility is None else np.asarray(visibility)
+        self._frameIndex = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __str__(self):
+        return f'BoundingBoxArray with {len(self)} boxes in {len(self.frames)} frames'
+
+    def __getitem__(self, item) -> 'BoundingBox | BoundingBoxArray':
+        """ An int returns a single BoundingBox, slices return views and index arrays/masks return copies """
+        if isinstance(item, (int, np.integer)):
+            return self.toBoxes(item)[0]
+        return BoundingBoxArray(*(None if column is None else column[item] for column in self.columns()))
+
+    def columns(self) -> list[ndarray | None]:
+        return [getattr(self, key) for key in BoundingBoxArray.COLUMNS]
+
+    @property
+    def right(self) -> ndarray:
+        return self.left + self.width
+
+    @property
+    def bottom(self) -> ndarray:
+        return self.top + self.height
+
+    @property
+    def center_x(self) -> ndarray:
+        return self.left + self.width / 2
+
+    @property
+    def center_y(self) -> ndarray:
+        return self.top + self.height / 2
+
+    @property
+    def area(self) -> ndarray:
+        return self.width * self.height
+
+    def getTuples(self) -> ndarray:
+        """ Returns a (n, 4) array of (left, top, width, height) """
+        return np.stack((self.left, self.top, self.width, self.height), axis=1)
+
+    @staticmethod
+    def fromBoxes(boxes: list[BoundingBox]) -> 'BoundingBoxArray':
+        """ Creates a BoundingBoxArray from a list of boxes (same order)
+
+        :param boxes: list of boxes
+        :return: Returns the boxes as BoundingBoxArray
+        """
+        columns = []
+        for key in BoundingBoxArray.COLUMNS:
+            values = [getattr(box, key) for box in boxes]
+            if key in ('confidence', 'class_id', 'visibility'):
+                if all(value is None for value in values) and values:
+                    columns.append(None)
+                    continue
+                if any(value is None for value in values):
+                    values = [np.nan if value is None else value for value in values]
+                    columns.append(np.array(values, dtype=np.float64))
+                    continue
+            columns.append(np.array(values, dtype=np.int64 if key in ('frame', 'box_id', 'class_id') else np.float64))
+        return BoundingBoxArray(*columns)
+
+    @staticmethod
+    def fromColumns(columns: dict[str, ndarray]) -> 'BoundingBoxArray':
+        """ Creates a BoundingBoxArray from a dict of columns (e.g. of fileHandler.loadBoxColumns)
+
+        :param columns: dict of column name to array
+        :return: Returns the boxes as BoundingBoxArray
+        """
+        return BoundingBoxArray(*(columns.get(key) for key in BoundingBoxArray.COLUMNS))
+
+    @staticmethod
+    def concatenate(arrays: list['BoundingBoxArray']) -> 'BoundingBoxArray':
+        """ Concatenates multiple BoundingBoxArrays (optional columns missing in some arrays are filled with NaN)
+
+        :param arrays: the arrays to concatenate
+        :return: Returns one BoundingBoxArray
+        """
+        columns = []
+        for key in BoundingBoxArray.COLUMNS:
+            values = [getattr(array, key) for array in arrays]
+            if all(value is None for value in values) and values:
+                columns.append(None)
+            else:
+                columns.append(np.concatenate([np.full(len(array), np.nan) if value is None else value
+                                               for array, value in zip(arrays, values)]))
+        return BoundingBoxArray(*columns)
+
+    def toBoxes(self, item=slice(None)) -> list[BoundingBox]:
+        """ Converts the boxes back to a list of BoundingBox objects
+
+        :param item: Optional index/slice of the boxes to convert
+        :return: Returns the list of boxes
+        """
+        values = []
+        for key, column in zip(BoundingBoxArray.COLUMNS, self.columns()):
+            column = np.atleast_1d(np.asarray(column)[item]) if column is not None else None
+            if column is None:
+                values.append([None] * len(np.atleast_1d(self.frame[item])))
+            elif key in ('confidence', 'class_id', 'visibility') and column.dtype.kind == 'f':
+                cast = int if key == 'class_id' else float
+                values.append([None if np.isnan(value) else cast(value) for value in column.tolist()])
+            else:
+                values.append(column.tolist())
+        return [BoundingBox(*row) for row in zip(*values)]
+
+    @property
+    def frames(self) -> ndarray:
+        """ All frames with at least one box (sorted) """
+        return self._getFrameIndex()[1]
+
+    def inFrame(self, frame: int) -> 'BoundingBoxArray':
+        """ Returns all boxes of a frame. If the boxes are sorted by frame, this is a view without copying
+
+        :param frame: The frame
+        :return: Returns the boxes of the frame
+        """
+        order, frames, starts = self._getFrameIndex()
+        i = np.searchsorted(frames, frame)
+        if i == len(frames) or frames[i] != frame:
+            return self[0:0]
+        item = slice(starts[i], starts[i + 1])
+        return self[item] if order is None else self[order[item]]
+
+    def _getFrameIndex(self) -> tuple[ndarray | None, ndarray, ndarray]:
+        """ Builds (once) the frame index: the order sorting the boxes by frame (None if already sorted),
+        the unique frames and the start of every frame in the sorted boxes (plus the end) """
+        if self._frameIndex is None:
+            order = None if np.all(self.frame[1:] >= self.frame[:-1]) else np.argsort(self.frame, kind='stable')
+            frames, starts = np.unique(self.frame if order is None else self.frame[order], return_index=True)
+            self._frameIndex = order, frames, np.append(starts, len(self))
+        return self._frameIndex
+
+    @staticmethod
+    def intersectionOverUnion(boxes1: 'BoundingBoxArray', boxes2: 'BoundingBoxArray') -> ndarray:
+        """ Calculates the intersection over union of every pair of boxes
+
+        :param boxes1: The first boxes (n)
+        :param boxes2: The second boxes (m)
+        :return: Returns the (n, m) matrix of the intersection over union
+        """
+        # Calculate intersection
+        intersection = np.maximum(0, np.minimum(boxes1.right[:, None], boxes2.right[None, :])
+                                  - np.maximum(boxes1.left[:, None], boxes2.left[None, :])) * \
+            np.maximum(0, np.minimum(boxes1.bottom[:, None], boxes2.bottom[None, :])
+                       - np.maximum(boxes1.top[:, None], boxes2.top[None, :]))
+
+        # Calculate union
+        union = boxes1.area[:, None] + boxes2.area[None, :] - intersection
+
+        return intersection / union
+
+    @staticmethod
+    def elementwiseIntersectionOverUnion(boxes1: 'BoundingBoxArray', boxes2: 'BoundingBoxArray') -> ndarray:
+        """ Calculates the intersection over union of boxes1[i] and boxes2[i] (instead of every pair)
+
+        :param boxes1: The first boxes (n)
+        :param boxes2: The second boxes (n)
+        :return: Returns the (n,) array of the intersection over union
+        """
+        intersection = np.maximum(0, np.minimum(boxes1.right, boxes2.right) - np.maximum(boxes1.left, boxes2.left)) * \
+            np.maximum(0, np.minimum(boxes1.bottom, boxes2.bottom) - np.maximum(boxes1.top, boxes2.top))
+        return intersection / (boxes1.area + boxes2.area - intersection)
+
+    @staticmethod
+    def overlaps(boxes1: 'BoundingBoxArray', boxes2: 'BoundingBoxArray') -> ndarray:
+        """ Checks for every pair of boxes if the second box is completely inside the first box
+
+        :param boxes1: The first boxes (n)
+        :param boxes2: The second boxes (m)
+        :return: Returns the (n, m) bool matrix; True if boxes2[j] is completely inside boxes1[i]
+        """
+        return (boxes1.left[:, None] <= boxes2.left[None, :]) & (boxes1.top[:, None] <= boxes2.top[None, :]) \
+            & (boxes1.right[:, None] >= boxes2.right[None, :]) & (boxes1.bottom[:, None] >= boxes2.bottom[None, :])
+
+    @staticmethod
+    def distance(boxes1: 'BoundingBoxArray', boxes2: 'BoundingBoxArray') -> ndarray:
+        """ Calculates the distance between the centers of every pair of boxes
+
+        :param boxes1: The first boxes (n)
+        :param boxes2: The second boxes (m)
+        :return: Returns the (n, m) matrix of the distances
+        """
+        return np.sqrt((boxes1.center_x[:, None] - boxes2.center_x[None, :]) ** 2
+                       + (boxes1.center_y[:, None] - boxes2.center_y[None, :]) ** 2)
+
+    def isNearBorder(self, border_width: float, img_shape: tuple) -> ndarray:
+        """ Checks for every box if it is near the border of the image
+
+        :param border_width: The width of the border (in percent)
+        :param img_shape: The shape of the image
+        :return: Returns a bool mask; True if the box is near the border of the image
+        """
+        thicc = img_shape[1] * border_width
+        return (self.center_x < thicc) | (self.center_x > img_shape[1] - thicc) \
+            | (self.center_y < thicc) | (self.center_y > img_shape[0] - thicc)
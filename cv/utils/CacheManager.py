@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import cv2 as cv
+
+
+class CacheManager:
+    def __init__(self, path: str = 'out/cache/', budget: int | None = None, *, printInfo: bool = True):
+        """ Manages the files of a cache folder (e.g. the masks of the background subtractions)
+
+        Every entry is keyed by a hash of the algorithm, its (canonicalized) parameters and a fingerprint of the input
+        video, so different parameters or videos can not collide. A JSON manifest in the cache folder keeps the size
+        and the last access of every entry; if the entries exceed the budget, the least recently used ones are deleted.
+        The manifest is only changed while holding a lock file, so several runs can share the cache folder
+
+        :param path: path of the cache folder
+        :param budget: max size of all entries in bytes (None = unlimited); the attribute is read on every register,
+                       so it can be changed at any time
+        :param printInfo: If True, prints a message for every evicted entry
+        """
+        self.path = path
+        self.budget = budget
+        self.printInfo = printInfo
+        self.manifestPath = os.path.join(path, 'manifest.json')
+        self.lockPath = self.manifestPath + '.lock'
+        self.__pending: dict[str, dict] = {}  # entries which are currently written (key: path)
+
+    @staticmethod
+    def key(algorithm: str, params: dict, fingerprint: str) -> str:
+        """ Stable key of an entry; the parameters are canonicalized (sorted keys, JSON) before hashing """
+        canonical = json.dumps({'algorithm': algorithm, 'params': params, 'video': fingerprint},
+                               sort_keys=True, default=str)
+        return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def videoFingerprint(video: cv.VideoCapture) -> str:
+        """ Fingerprint of a video: frame count, size, fps and a hash of the first frame (the position is restored)
+
+        :param video: the video
+        :return: Returns the fingerprint
+        """
+        position = video.get(cv.CAP_PROP_POS_FRAMES)
+        video.set(cv.CAP_PROP_POS_FRAMES, 0)
+        ret, frame = video.read()
+        video.set(cv.CAP_PROP_POS_FRAMES, position)
+        first_frame = hashlib.sha1(frame.tobytes()).hexdigest() if ret else ''
+        return '_'.join(str(value) for value in (int(video.get(cv.CAP_PROP_FRAME_COUNT)),
+                                                  int(video.get(cv.CAP_PROP_FRAME_WIDTH)),
+                                                  int(video.get(cv.CAP_PROP_FRAME_HEIGHT)),
+                                                  video.get(cv.CAP_PROP_FPS), first_frame))
+
+    def entryPath(self, algorithm: str, params: dict, video: cv.VideoCapture | None, videoId, extension: str) -> str:
+        """ Returns the path of the entry; register has to be called after the file is written
+
+        :param algorithm: name of the algorithm
+        :param params: parameters of the algorithm
+        :param video: the input video (None = only the videoId identifies the video)
+        :param videoId: id of the video (folder of the entry)
+        :param extension: file extension of the entry
+        :return: Returns the path of the entry
+        """
+        fingerprint = f'id_{videoId}' if video is None else CacheManager.videoFingerprint(video)
+        key = CacheManager.key(algorithm, params, fingerprint)
+        path = os.path.join(self.path, str(videoId), f'{algorithm}__{key}{extension}')
+        self.__pending[path] = {'algorithm': algorithm, 'params': json.loads(json.dumps(params, default=str)),
+                                'video': fingerprint}
+        return path
+
+    def lookup(self, path: str) -> bool:
+        """ Checks if an entry exists and marks it as used
+
+        :param path: path of the entry
+        :return: True if the entry exists
+        """
+        name = self.__name(path)
+        with self.__locked():
+            manifest = self.__load()
+            if not os.path.isfile(path):  # the entry is kept in pending, the caller writes and registers it
+                if manifest.pop(name, None) is not None:
+                    self.__save(manifest)
+                return False
+            entry = manifest.setdefault(name, {**self.__pending.pop(path, {}), 'size': os.path.getsize(path)})
+            entry['lastAccess'] = time.time()
+            self.__save(manifest)
+        return True
+
+    def register(self, path: str) -> None:
+        """ Adds a written entry to the manifest and evicts the least recently used entries if over budget
+
+        :param path: path of the entry (of entryPath)
+        """
+        name = self.__name(path)
+        with self.__locked():
+            manifest = self.__load()
+            manifest[name] = {**self.__pending.pop(path, {}), 'size': os.path.getsize(path),
+                              'lastAccess': time.time()}
+            if self.budget is not None:
+                total = sum(entry['size'] for entry in manifest.values())
+                for old_name in sorted(manifest, key=lambda key: manifest[key]['lastAccess']):
+                    if total <= self.budget:
+                        break
+                    if old_name == name:
+                        continue
+                    try:
+                        old_path = os.path.join(self.path, old_name)
+                        if os.path.isfile(old_path):
+                            os.remove(old_path)
+                    except OSError:
+                        # still opened by a process (e.g. memory-mapped on Windows), evicted by a later register
+                        continue
+                    total -= manifest.pop(old_name)['size']
+                    if self.printInfo:
+                        print(f'Evicted cache entry {old_name}')
+            self.__save(manifest)
+
+    def size(self) -> int:
+        """ Size of all entries in bytes """
+        with self.__locked():
+            return sum(entry['size'] for entry in self.__load().values())
+
+    def __name(self, path: str) -> str:
+        """ Name of an entry in the manifest (path relative to the cache folder) """
+        return os.path.relpath(path, self.path).replace('\\', '/')
+
+    @contextmanager
+    def __locked(self, timeout: float = 60.0):
+        """ Holds the lock file of the manifest (created exclusively, so only one process can hold it). A lock older
+        than timeout is treated as left over by a crashed run and removed """
+        os.makedirs(self.path, exist_ok=True)
+        while True:
+            try:
+                os.close(os.open(self.lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lockPath) > timeout:
+                        os.remove(self.lockPath)
+                        continue
+                except FileNotFoundError:  # released in the meantime
+                    continue
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.remove(self.lockPath)
+
+    def __load(self) -> dict[str, dict]:
+        if not os.path.isfile(self.manifestPath):
+            return {}
+        with open(self.manifestPath) as file:
+            return json.load(file)
+
+    def __save(self, manifest: dict[str, dict]) -> None:
+        # every process writes its own temporary file, so a replace never moves a half-written manifest into place
+        tmp_path = f'{self.manifestPath}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(manifest, file, indent=1)
+        os.replace(tmp_path, self.manifestPath)
@@ -1,21 +1,25 @@
 import os
 import time
+import warnings
 
 import cv2 as cv
+import numpy as np
 from numpy import ndarray
 
 from cv.utils.BoundingBox import BoundingBox as Box
+from cv.utils.BoundingBoxArray import BoundingBoxArray as BoxArray
 from cv.utils.video import videoToFrames
 
 
-def loadFrames(directory: str, getVideo: bool, count=2, *, getName: bool = False) -> \
-    tuple | list[list[ndarray] | cv.VideoCapture | list[Box] | dict[str, str]]:
+def loadFrames(directory: str, getVideo: bool, count=2, *, getName: bool = False, getPath: bool = False) -> \
+    tuple | list[list[ndarray] | cv.VideoCapture | str | list[Box] | dict[str, str]]:
     """ Loads a video from a directory and returns it as a list of frames or the video itself
 
     :param directory: The directory of the folder
     :param getVideo: If True, the function will return a cv.VideoCapture object instead of a list of frames
     :param count: The number of folder to load
     :param getName: If True, the function will return a tuple of the name and the frames or video
+    :param getPath: If True (and getVideo), the function will return the path of the video instead of opening it
     :return: Returns a list of [type[frames | video]]
     """
     retList: list = [[] for _ in range(count)]
@@ -30,6 +34,9 @@ def loadFrames(directory: str, getVideo: bool, count=2, *, getName: bool = False
                     break
                 if file.endswith('.avi'):
                     names.append(file)
+                    if getVideo and getPath:
+                        retList[i] = directory + folder + '\\' + file
+                        break
                     cap = cv.VideoCapture(directory + folder + '\\' + file)
                     if getVideo:
                         retList[i] = cap
@@ -62,6 +69,16 @@ def loadFolderMileStone2(directory: str, getVideo: bool = False, *, printInfo: b
     return ret
 
 
+# columns of the supported MOT formats (None = ignored)
+BOX_COLUMNS = {'frame': np.int64, 'box_id': np.int64, 'left': np.float64, 'top': np.float64, 'width': np.float64,
+               'height': np.float64, 'confidence': np.float64, 'class_id': np.int64, 'visibility': np.float64}
+BOX_FORMATS = {
+    6: ('frame', 'box_id', 'left', 'top', 'width', 'height'),
+    9: ('frame', 'box_id', 'left', 'top', 'width', 'height', 'confidence', 'class_id', 'visibility'),
+    10: ('frame', 'box_id', 'left', 'top', 'width', 'height', 'confidence', None, None, None),  # ignoring x,y,z
+}
+
+
 def loadBoxes(path, *, debugPrint=False) -> list[Box]:
     """ Reads the bounding boxes file and returns a list of bounding boxes
 
@@ -82,26 +99,70 @@ def loadBoxes(path, *, debugPrint=False) -> list[Box]:
             print(f'Loading boxes from {file}')
         if not file.endswith('.txt'):
             continue
-        with open(path + file, 'r') as f:
-            lines = f.readlines()
-            if debugPrint:
-                print(f'Lines Count: {len(lines)}')
-            for line in lines:
-                data = line.split(',')
-                if len(data) == 10:
-                    frame, box_id, x, y, w, h, conf, _x, _y, _z = data  # ignoring x,y,z
-                    boxes.append(Box(int(frame), int(box_id), float(x), float(y), float(w), float(h), float(conf)))
-                elif len(data) == 9:
-                    frame, box_id, x, y, w, h, conf, box_class, vis = data
-                    boxes.append(Box(int(frame), int(box_id), float(x), float(y), float(w), float(h), float(conf),
-                                     int(box_class), float(vis)))
-                elif len(data) == 6:
-                    frame, box_id, x, y, w, h = data
-                    boxes.append(Box(int(frame), int(box_id), float(x), float(y), float(w), float(h)))
+        columns = loadBoxColumns(path + file)
+        if debugPrint:
+            print(f'Lines Count: {len(columns.get("frame", []))}')
+        if not columns:
+            continue
+        boxes.extend(BoxArray.fromColumns(columns).toBoxes())
 
     return boxes
 
 
+def loadBoxArray(path) -> BoxArray:
+    """ Reads all bounding boxes files in a folder as one BoundingBoxArray (without creating a BoundingBox per line)
+
+    :param path: The path to the folder of the bounding boxes files
+    :return: Returns the bounding boxes of all files (same order as loadBoxes)
+    """
+    arrays = []
+    for file in os.listdir(path):
+        if not file.endswith('.txt'):
+            continue
+        columns = loadBoxColumns(path + file)
+        if columns:
+            arrays.append(BoxArray.fromColumns(columns))
+    return BoxArray.concatenate(arrays) if arrays else BoxArray.fromBoxes([])
+
+
+def loadBoxColumns(file: str, *, useCache: bool = True) -> dict[str, ndarray]:
+    """ Parses a bounding boxes file (MOT format with 6, 9 or 10 columns) into typed columns
+
+    The columns are cached in a binary sidecar (<file>.npz) which is reused as long as
+    the modification time and the size of the file do not change
+
+    :param file: The path to the bounding boxes file
+    :param useCache: If False, the sidecar is neither read nor written
+    :return: Returns a dict of column name to array (empty dict for empty or unsupported files)
+    """
+    stat = os.stat(file)
+    sidecar = file + '.npz'
+    if useCache and os.path.isfile(sidecar):
+        try:
+            with np.load(sidecar) as data:
+                if data['mtime_ns'] == stat.st_mtime_ns and data['size'] == stat.st_size:
+                    return {key: data[key] for key in BOX_COLUMNS if key in data}
+        except (OSError, ValueError, KeyError):
+            pass  # broken sidecar, parse again
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)  # empty file
+        data = np.loadtxt(file, delimiter=',', dtype=np.float64, ndmin=2)
+    columns = {}
+    for i, key in enumerate(BOX_FORMATS.get(data.shape[1], ())):
+        if key is not None:
+            columns[key] = data[:, i].astype(BOX_COLUMNS[key])
+
+    if useCache:
+        try:
+            with open(sidecar + '.tmp', 'wb') as f:
+                np.savez(f, mtime_ns=stat.st_mtime_ns, size=stat.st_size, **columns)
+            os.replace(sidecar + '.tmp', sidecar)
+        except OSError:
+            pass  # read only folder, just parse the text file next time
+    return columns
+
+
 def loadFolderMileStone3(directory: str, getVideo: bool = True, *, printInfo: bool = False) -> \
     list[list[list[ndarray] | cv.VideoCapture | list[Box]]]:
     """ Loads all frames from a milestone 3 folder and returns them in a list
@@ -125,13 +186,14 @@ def loadFolderMileStone3(directory: str, getVideo: bool = True, *, printInfo: bo
     return ret
 
 
-def loadFolderMileStone4(directory: str, getVideo: bool = True, *, printInfo: bool = False) -> list[
-    list[list[ndarray] | cv.VideoCapture | list[Box]]]:
+def loadFolderMileStone4(directory: str, getVideo: bool = True, *, printInfo: bool = False,
+                         getPath: bool = False) -> list[list[list[ndarray] | cv.VideoCapture | str | list[Box]]]:
     """ Loads all frames from a milestone 4 folder and returns them in a list
 
         :param directory: The directory of the milestone folder
         :param getVideo: If True, the function will return a list of cv.VideoCapture objects instead of lists of frames
         :param printInfo: If True, the function will print a small message with max 5 names of found videos
+        :param getPath: If True (and getVideo), the function will return the paths of the videos instead of opening them
         :return: Returns a list of [videos[type[frames | video | boxes]]]
     """
     ret = [[] for _ in range(len(list(filter(lambda x: os.path.isdir(directory + x), os.listdir(directory)))))]
@@ -139,7 +201,7 @@ def loadFolderMileStone4(directory: str, getVideo: bool = True, *, printInfo: bo
     for i, folder in enumerate(os.listdir(directory)):
         if not os.path.isdir(directory + folder):
             continue
-        retNames, ret[i] = loadFrames(directory + folder + '\\', getVideo, 4, getName=True)
+        retNames, ret[i] = loadFrames(directory + folder + '\\', getVideo, 4, getName=True, getPath=getPath)
         names.extend(retNames)
     if printInfo:
         # print small message with max 5 names
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+    def __init__(self, enabled: bool = True, name: str = 'Default'):
+        """ Lightweight instrumentation of the hot paths: timed sections and counters, grouped by frame.
+        If disabled, section returns a shared no-op context and count returns immediately
+
+        Usage:
+            with profiler.section('matching'):
+                ...
+            profiler.count('tracks', len(tracks))
+
+        :param enabled: If False, nothing is recorded
+        :param name: name of the profiled run (process name in the trace)
+        """
+        self.enabled = enabled
+        self.name = name
+        self.frame = None  # current frame, added to every event
+        self.sections: list[tuple[str, float, float, int | None]] = []  # (name, start, duration, frame)
+        self.counters: list[tuple[str, float, float, int | None]] = []  # (name, time, value, frame)
+        self.__start = time.perf_counter()
+
+    def section(self, name: str):
+        """ Context manager timing the code inside it """
+        if not self.enabled:
+            return _DISABLED
+        return self.__section(name)
+
+    @contextmanager
+    def __section(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections.append((name, start, time.perf_counter() - start, self.frame))
+
+    def count(self, name: str, value: float) -> None:
+        """ Records the value of a counter (e.g. the number of tracks) in the current frame """
+        if self.enabled:
+            self.counters.append((name, time.perf_counter(), value, self.frame))
+
+    def summary(self) -> list[dict]:
+        """ Returns the statistics of every section (calls, total, mean and max time in ms, share of the run time)
+        and every counter (mean and max value) """
+        total = time.perf_counter() - self.__start
+        rows = []
+        durations: dict[str, list[float]] = {}
+        for name, _, duration, _ in self.sections:
+            durations.setdefault(name, []).append(duration)
+        for name, values in durations.items():
+            rows.append({'name': name, 'calls': len(values), 'totalMs': sum(values) * 1000,
+                         'meanMs': sum(values) / len(values) * 1000, 'maxMs': max(values) * 1000,
+                         'share': sum(values) / total if total > 0 else 0.0})
+        counter_values: dict[str, list[float]] = {}
+        for name, _, value, _ in self.counters:
+            counter_values.setdefault(name, []).append(value)
+        for name, values in counter_values.items():
+            rows.append({'name': name, 'calls': len(values), 'mean': sum(values) / len(values), 'max': max(values)})
+        return rows
+
+    def printSummary(self) -> None:
+        """ Prints the summary as a table """
+        if not self.enabled:
+            return
+        print(f'{self.name} -- Profile')
+        rows = self.summary()
+        print(f'{"section":<20}{"calls":>8}{"total ms":>12}{"mean ms":>10}{"max ms":>10}{"share":>8}')
+        for row in rows:
+            if 'totalMs' in row:
+                print(f'{row["name"]:<20}{row["calls"]:>8}{row["totalMs"]:>12.1f}{row["meanMs"]:>10.3f}'
+                      f'{row["maxMs"]:>10.3f}{row["share"]:>8.1%}')
+        print(f'{"counter":<20}{"samples":>8}{"mean":>12}{"max":>10}')
+        for row in rows:
+            if 'mean' in row:
+                print(f'{row["name"]:<20}{row["calls"]:>8}{row["mean"]:>12.1f}{row["max"]:>10.1f}')
+
+    def saveTrace(self, path: str) -> None:
+        """ Saves the events in the Chrome trace event format (chrome://tracing, Perfetto)
+
+        :param path: path of the JSON file
+        """
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.name}}]
+        for name, start, duration, frame in self.sections:
+            events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': (start - self.__start) * 1e6,
+                           'dur': duration * 1e6, 'args': {'frame': frame}})
+        for name, timestamp, value, frame in self.counters:
+            events.append({'name': name, 'ph': 'C', 'pid': pid, 'ts': (timestamp - self.__start) * 1e6,
+                           'args': {name: value}})
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
@@ -0,0 +1,49 @@
+import numpy as np
+from numpy import ndarray
+
+
+def radiusPairs(pointsA: ndarray, pointsB: ndarray, radius: float, strict: bool = False) -> tuple[ndarray, ndarray]:
+    """ Finds all pairs of points closer than or equal to radius using a uniform grid (cell size = radius),
+    so only points in neighbouring cells are compared instead of all pairs
+
+    :param pointsA: (n, 2) points
+    :param pointsB: (m, 2) points
+    :param radius: search radius (> 0)
+    :param strict: If True, only pairs closer than radius are returned
+    :return: indexes into pointsA and pointsB of all pairs within the radius (sorted by the index into pointsA)
+    """
+    if radius <= 0:
+        raise ValueError(f'radius must be > 0, got {radius}')
+    pointsA = np.asarray(pointsA, dtype=np.float64).reshape(-1, 2)
+    pointsB = np.asarray(pointsB, dtype=np.float64).reshape(-1, 2)
+    if len(pointsA) == 0 or len(pointsB) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    cellsA = np.floor(pointsA / radius).astype(np.int64)
+    cellsB = np.floor(pointsB / radius).astype(np.int64)
+    # shifts the cells to start at 1, so the neighbours of every cell have a non-negative key
+    origin = np.minimum(cellsA.min(axis=0), cellsB.min(axis=0)) - 1
+    cellsA -= origin
+    cellsB -= origin
+    height = max(cellsA[:, 1].max(), cellsB[:, 1].max()) + 2
+    keysB = cellsB[:, 0] * height + cellsB[:, 1]
+    order = np.argsort(keysB, kind='stable')
+    sortedKeysB = keysB[order]
+
+    rows, cols = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = (cellsA[:, 0] + dx) * height + cellsA[:, 1] + dy
+            lo = np.searchsorted(sortedKeysB, keys, side='left')
+            counts = np.searchsorted(sortedKeysB, keys, side='right') - lo
+            # every point of A paired with every point of B in the cell (lo ... lo + count - 1)
+            rows.append(np.repeat(np.arange(len(pointsA)), counts))
+            cols.append(order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+
+    distances = np.sum((pointsA[rows] - pointsB[cols]) ** 2, axis=1)
+    keep = distances < radius ** 2 if strict else distances <= radius ** 2
+    rows, cols = rows[keep], cols[keep]
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order]
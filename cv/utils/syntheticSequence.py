@@ -0,0 +1,76 @@
+import os
+
+import cv2 as cv
+import numpy as np
+
+
+def generateSequence(directory: str, *, width: int = 640, height: int = 480, length: int = 300, objects: int = 10,
+                     seed: int = 0, fps: int = 30, missRate: float = 0.05, falsePositives: float = 0.5,
+                     noise: float = 1.5) -> dict[str, str]:
+    """ Generates a deterministic synthetic sequence in the layout of a milestone 4 sequence:
+    <directory>/det/det.txt, <directory>/gt/gt.txt (MOT format), <directory>/img1/<name>.avi (FFV1) and seqinfo.ini
+
+    The video shows colored rectangles moving with constant speed (bouncing at the borders) on a textured background.
+    The ground truth are the rectangles, the detections are the ground truth with noise, misses and false positives
+
+    :param directory: The directory of the sequence (created if it does not exist)
+    :param width: The width of the video
+    :param height: The height of the video
+    :param length: The number of frames
+    :param objects: The number of objects (density of the sequence)
+    :param seed: The seed of the random generator (same seed = same sequence)
+    :param fps: The frames per second of the video
+    :param missRate: The probability that an object is not detected in a frame
+    :param falsePositives: The average number of false detections per frame
+    :param noise: The standard deviation of the position noise of the detections (in pixels)
+    :return: Returns the paths of the sequence ('video', 'det', 'gt', 'seqinfo')
+    """
+    rng = np.random.default_rng(seed)
+    name = os.path.basename(os.path.normpath(directory))
+    paths = {'video': os.path.join(directory, 'img1', f'{name}.avi'), 'det': os.path.join(directory, 'det', 'det.txt'),
+             'gt': os.path.join(directory, 'gt', 'gt.txt'), 'seqinfo': os.path.join(directory, 'seqinfo.ini')}
+    for path in paths.values():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # objects: size, start position, velocity and color
+    sizes = np.stack((rng.uniform(0.03, 0.08, objects) * width, rng.uniform(0.1, 0.25, objects) * height), axis=1)
+    positions = rng.uniform(0, 1, (objects, 2)) * (np.array([width, height]) - sizes)
+    velocities = rng.uniform(-3, 3, (objects, 2))
+    colors = rng.integers(0, 256, (objects, 3))
+    background = cv.GaussianBlur(rng.integers(40, 90, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+
+    writer = cv.VideoWriter(paths['video'], cv.VideoWriter_fourcc(*'FFV1'), fps, (width, height))
+    gt_lines, det_lines = [], []
+    for frame in range(1, length + 1):
+        img = background.copy()
+        for i in range(objects):
+            left, top = positions[i]
+            right, bottom = left + sizes[i]
+            cv.rectangle(img, (round(left), round(top)), (round(right), round(bottom)), colors[i].tolist(), -1)
+            gt_lines.append(f'{frame},{i + 1},{left:.2f},{top:.2f},{sizes[i, 0]:.2f},{sizes[i, 1]:.2f},1,1,1.0')
+            if rng.random() >= missRate:
+                jitter = rng.normal(0, noise, 4)
+                det_lines.append(f'{frame},-1,{left + jitter[0]:.2f},{top + jitter[1]:.2f},'
+                                 f'{sizes[i, 0] + jitter[2]:.2f},{sizes[i, 1] + jitter[3]:.2f},'
+                                 f'{rng.uniform(0.3, 1.0):.4f},-1,-1,-1')
+        for _ in range(rng.poisson(falsePositives)):
+            size = rng.uniform(0.03, 0.08) * width, rng.uniform(0.1, 0.25) * height
+            det_lines.append(f'{frame},-1,{rng.uniform(0, width - size[0]):.2f},{rng.uniform(0, height - size[1]):.2f},'
+                             f'{size[0]:.2f},{size[1]:.2f},{rng.uniform(0.0, 0.6):.4f},-1,-1,-1')
+        writer.write(img)
+
+        # moves the objects and bounces them off the borders
+        positions += velocities
+        outside = (positions < 0) | (positions + sizes > np.array([width, height]))
+        velocities[outside] *= -1
+        positions = np.clip(positions, 0, np.array([width, height]) - sizes)
+    writer.release()
+
+    with open(paths['gt'], 'w') as file:
+        file.write('\n'.join(gt_lines) + '\n')
+    with open(paths['det'], 'w') as file:
+        file.write('\n'.join(det_lines) + '\n')
+    with open(paths['seqinfo'], 'w') as file:
+        file.write(f'[Sequence]\nname={name}\nimDir=img1\nframeRate={fps}\nseqLength={length}\n'
+                   f'imWidth={width}\nimHeight={height}\nimExt=.avi\n')
+    return paths
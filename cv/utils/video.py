@@ -1,5 +1,8 @@
 import os
 import time
+from collections import OrderedDict
+from queue import Queue, Empty, Full
+from threading import Thread, Event
 
 import cv2 as cv
 from numpy import ndarray
@@ -66,6 +69,29 @@ def playImageAsVideo(img, fps=60, name="Video") -> bool:
     return True
 
 
+def drawBoxes(img: ndarray, boxes: list, color: tuple[int, int, int] = (0, 255, 0), alpha: float = 1.0,
+              thickness: int = 2, font_color: tuple[int, int, int] = (0, 0, 0)) -> ndarray:
+    """ Draws all boxes (see BoundingBox.draw) onto the image in one pass.
+    Opaque boxes are drawn directly onto the image, transparent ones onto a single overlay, which is blended once
+
+    :param img: The image to draw on (modified in place)
+    :param boxes: The boxes to draw
+    :param color: The color of the boxes
+    :param alpha: The transparency of the boxes
+    :param thickness: The thickness of the boxes
+    :param font_color: The color of the text on the boxes
+    :return: Returns the image
+    """
+    if not boxes:
+        return img
+    overlay = img if alpha == 1.0 else img.copy()
+    for box in boxes:
+        box.draw(overlay, color, thickness, font_color)
+    if overlay is not img:
+        cv.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
+    return img
+
+
 def getFrameFromVideo(video: cv.VideoCapture, frameIndex: int) -> ndarray:
     """ Returns a frame from a video
 
@@ -80,3 +106,278 @@ def getFrameFromVideo(video: cv.VideoCapture, frameIndex: int) -> ndarray:
         raise Exception("Error reading frame")
     video.set(cv.CAP_PROP_POS_FRAMES, oldFrameIndex)
     return frame
+
+
+class FramePrefetcher:
+    def __init__(self, video: cv.VideoCapture, queueSize: int = 8):
+        """ Decodes the frames of a video in a background thread, so decoding overlaps with the work on a frame
+        Can be used like the cv.VideoCapture (read, isOpened, release)
+
+        :param video: The video to read (from its current position)
+        :param queueSize: Maximum number of decoded frames waiting in the queue
+        """
+        self.video = video
+        self.waitTime = 0.0  # seconds the consumer waited for a decoded frame
+        self.frames = 0  # frames handed to the consumer
+        self.__queue = Queue(maxsize=queueSize)
+        self.__stop = Event()
+        self.__done = False
+        self.__error = None  # exception of the decoding thread, until it is raised by read or release
+        self.__thread = Thread(target=self.__decode, daemon=True)
+        self.__thread.start()
+
+    def __decode(self):
+        try:
+            while not self.__stop.is_set():
+                ret, frame = self.video.read()
+                self.__put((ret, frame))
+                if not ret:
+                    break
+        except Exception as error:
+            # passed through the queue, so the consumer fails instead of waiting forever
+            self.__error = error
+            self.__put(error)
+
+    def __put(self, item) -> None:
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(item, timeout=0.1)
+                break
+            except Full:
+                continue
+
+    def read(self) -> tuple[bool, ndarray | None]:
+        """ Returns the next frame like cv.VideoCapture.read (blocks until it is decoded)
+        Raises the exception of the decoding thread if decoding failed
+
+        :return: Returns (True, frame) or (False, None) at the end of the video
+        """
+        if self.__done:
+            return False, None
+        start = time.perf_counter()
+        item = self.__queue.get()
+        self.waitTime += time.perf_counter() - start
+        if isinstance(item, Exception):
+            self.__done = True
+            self.__error = None
+            raise item
+        ret, frame = item
+        if not ret:
+            self.__done = True
+            return False, None
+        self.frames += 1
+        return ret, frame
+
+    def isOpened(self) -> bool:
+        return not self.__done and self.video.isOpened()
+
+    def release(self) -> None:
+        """ Stops the decoding thread and releases the video
+        Raises the exception of the decoding thread if read has not raised it yet """
+        self.__stop.set()
+        try:
+            while True:
+                self.__queue.get_nowait()
+        except Empty:
+            pass
+        self.__thread.join()
+        self.video.release()
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def __str__(self):
+        return f'waited {self.waitTime:.2f}s for {self.frames} decoded frames'
+
+
+class VideoWriterThread:
+    def __init__(self, path: str, fps: float = 30, fourcc: str = 'mp4v', queueSize: int = 16):
+        """ Encodes frames in a background thread, so encoding overlaps with the work on the next frame
+        Can be used like the cv.VideoWriter (write, isOpened, release). The video is opened with the first frame
+
+        :param path: The path of the video file
+        :param fps: The frames per second of the video
+        :param fourcc: The codec of the video
+        :param queueSize: Maximum number of frames waiting to be encoded
+        """
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.frames = 0  # frames handed to the encoder
+        self.__queue = Queue(maxsize=queueSize)
+        self.__writer = None
+        self.__error = None  # exception of the encoding thread, until it is raised by write or release
+        self.__thread = Thread(target=self.__encode, daemon=True)
+        self.__thread.start()
+
+    def __encode(self):
+        try:
+            while True:
+                frame = self.__queue.get()
+                if frame is None:
+                    return
+                if self.__writer is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self.__writer = cv.VideoWriter(self.path, cv.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                                   (frame.shape[1], frame.shape[0]))
+                    if not self.__writer.isOpened():
+                        raise Exception("Video could not be created at Path: " + self.path)
+                self.__writer.write(frame)
+        except Exception as error:
+            self.__error = error
+        # keeps emptying the queue until release, so write never blocks on a full queue (it raises the error)
+        while self.__queue.get() is not None:
+            pass
+
+    def __raiseError(self) -> None:
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def write(self, frame: ndarray) -> None:
+        """ Queues a frame for encoding (blocks if the queue is full). The frame must not be modified afterwards
+        Raises the exception of the encoding thread if encoding failed
+
+        :param frame: The frame
+        """
+        self.__raiseError()
+        self.__queue.put(frame)
+        self.frames += 1
+
+    def isOpened(self) -> bool:
+        return self.__thread.is_alive()
+
+    def release(self) -> None:
+        """ Encodes the remaining frames and closes the video
+        Raises the exception of the encoding thread if write has not raised it yet """
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+        if self.__writer is not None:
+            self.__writer.release()
+            self.__writer = None
+        self.__raiseError()
+
+
+class FrameStore:
+    def __init__(self, video: str | cv.VideoCapture, cacheBytes: int = 256 * 1024 ** 2, seekThreshold: int = None):
+        """ Random access to the frames of a video with a byte-bounded LRU cache of decoded frames.
+        Between getFrameFromVideo (seek and decode on every call) and loadFrames (all frames in RAM)
+
+        A seek has to decode from the previous keyframe, so a frame a few positions ahead is cheaper to reach by
+        skipping (grab without conversion) than by seeking. The break-even distance (seekThreshold) is measured once
+        when the store is opened; intra-only codecs (FFV1, MJPG) end up at ~1, long-GOP codecs at a few dozen frames
+
+        Usage:
+            store = FrameStore(path)
+            frame = store[42]  # read-only, copy it before drawing on it
+            frames = store.frames([7, 3, 5])  # decoded in ascending order
+
+        :param video: The path of the video or an opened video (released by release)
+        :param cacheBytes: Maximum size of the cached frames in bytes
+        :param seekThreshold: Max distance (in frames) to the requested frame that is skipped instead of seeking
+                              (None = measured)
+        """
+        self.video = cv.VideoCapture(video) if isinstance(video, str) else video
+        if not self.video.isOpened():
+            raise Exception(f"Video could not be opened: {video}")
+        self.count = int(self.video.get(cv.CAP_PROP_FRAME_COUNT))
+        self.cacheBytes = cacheBytes
+        self.cacheSize = 0  # bytes of the cached frames
+        self.position = int(self.video.get(cv.CAP_PROP_POS_FRAMES))  # frame the next read returns
+        self.hits = 0
+        self.decodes = 0
+        self.seeks = 0
+        self.__cache: OrderedDict[int, ndarray] = OrderedDict()
+        self.seekThreshold = self.__measureSeekThreshold() if seekThreshold is None else seekThreshold
+
+    def __measureSeekThreshold(self, samples: int = 3, reads: int = 8) -> int:
+        """ Returns the number of sequential decodes that cost as much as one seek (seeks into the middle of the
+        video, where the distance to the previous keyframe is typical) """
+        if self.count < 2:
+            return 0
+        seekTime, readTime, readCount = 0.0, 0.0, 0
+        for sample in range(1, samples + 1):
+            start = time.perf_counter()
+            self.__seek(self.count * sample // (samples + 1))
+            self.video.grab()
+            seekTime += time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(reads):
+                if not self.video.grab():
+                    break
+                readCount += 1
+            readTime += time.perf_counter() - start
+            self.position = int(self.video.get(cv.CAP_PROP_POS_FRAMES))
+        self.seeks = 0
+        if readCount == 0 or readTime == 0:
+            return 0
+        return max(1, round(seekTime / samples / (readTime / readCount)))
+
+    def __seek(self, index: int) -> None:
+        self.video.set(cv.CAP_PROP_POS_FRAMES, index)
+        self.position = index
+        self.seeks += 1
+
+    def __decode(self, index: int) -> ndarray:
+        """ Decodes a frame with the fewest decodes: skips forward if it is close ahead, otherwise seeks """
+        distance = index - self.position
+        if distance < 0 or distance > self.seekThreshold:
+            self.__seek(index)
+        while self.position < index:
+            self.video.grab()  # decodes without the conversion to BGR
+            self.position += 1
+            self.decodes += 1
+        ret, frame = self.video.read()
+        if not ret:
+            raise Exception("Error reading frame")
+        self.position += 1
+        self.decodes += 1
+        return frame
+
+    def __getitem__(self, index: int) -> ndarray:
+        """ Returns a frame (0 based) from the cache or decodes it. The frame is read-only (shared with the cache)
+
+        :param index: The index of the frame (negative = from the end)
+        :return: Returns the frame
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(f"Frame {index} out of range (0 - {self.count - 1})")
+        frame = self.__cache.get(index)
+        if frame is not None:
+            self.__cache.move_to_end(index)
+            self.hits += 1
+            return frame
+        frame = self.__decode(index)
+        frame.flags.writeable = False
+        if frame.nbytes <= self.cacheBytes:
+            self.__cache[index] = frame
+            self.cacheSize += frame.nbytes
+            while self.cacheSize > self.cacheBytes:  # evicts the least recently used frames
+                self.cacheSize -= self.__cache.popitem(last=False)[1].nbytes
+        return frame
+
+    def frames(self, indices) -> list[ndarray]:
+        """ Returns several frames; they are decoded in ascending order, so every seek is used for as many frames as
+        possible
+
+        :param indices: The indices of the frames
+        :return: Returns the frames in the order of indices
+        """
+        frames = {index: self[index] for index in sorted(set(indices))}
+        return [frames[index] for index in indices]
+
+    def __len__(self):
+        return self.count
+
+    def release(self) -> None:
+        """ Releases the video and clears the cache """
+        self.video.release()
+        self.__cache.clear()
+        self.cacheSize = 0
+
+    def __str__(self):
+        return (f'{self.hits} cache hits, {self.decodes} decoded frames, {self.seeks} seeks '
+                f'(seek threshold {self.seekThreshold} frames, cache {self.cacheSize / 1024 ** 2:.1f} MB)')
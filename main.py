@@ -1,19 +1,32 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import cv2 as cv
+import motmetrics as mm
 import numpy as np
 
-from cv.features.detections import confidenceFilter, iouFilter, overlapFilter, hungarianMatching
+from cv.features.HistogramStore import HistogramStore
+from cv.features.TrackStore import TrackStore
+from cv.features.detections import nmsFilter, hungarianMatching
 from cv.features.tracking import getHistosFromImgWithBBs
-from cv.processing.evaluation import evalMOTA
+from cv.processing.evaluation import StreamingMOTA, summarizeMOTA
 from cv.utils.BoundingBox import BoundingBox
+from cv.utils.BoundingBoxArray import BoundingBoxArray
+from cv.utils.CacheManager import CacheManager
 from cv.utils.fileHandler import loadFolderMileStone4
-from cv.utils.video import playImageAsVideo
+from cv.utils.profiler import Profiler
+from cv.utils.video import playImageAsVideo, FramePrefetcher, VideoWriterThread, drawBoxes
 
 IMAGES_PATH = os.path.dirname(os.path.abspath(__file__)) + '\\images\\'
 DISPLAY = False  # displays the images as an video (space to pause, esc to exit)
 HIDE_GT = False  # if true, the ground truth is not shown, if display is true
 HIDE_DET = False  # if true, the detection is not shown, if display is true
+RENDER = False  # if true, the annotated video is written to out/render/<video>.mp4 (no GUI needed)
+HISTO_CACHE = False  # if true, the histograms are read from an on-disk store (out/histos/<video>/) instead of computed
+HISTO_BUDGET = 5 * 1024 ** 3  # max size of all histogram stores in bytes (least recently used ones are deleted)
+WORKERS = 1  # number of processes tracking the videos in parallel (1 = serial, display always runs serial)
+PROFILE = False  # if true, the tracking loop is profiled (summary table and trace in out/profile/<video>.json)
 
 
 def getParams(**kwargs):
@@ -25,7 +38,11 @@ def getParams(**kwargs):
         'weightIou': 0.3,
         'weightHistos': 0.8,
         'maxHistoInHistory': 4,
+        'histoEma': None,  # None = mean of the last histos, else factor of an exponential moving average
         'score_threshold': 0.2,
+        'cascadeIou': None,  # None = no cascade, else min iou of a pair to be accepted before the hungarian algorithm
+        'gateDistance': None,  # None = score all pairs, else max center distance (percent of the image diagonal)
+        'gateIou': None,  # None = score all pairs, else min iou of a pair (combined with gateDistance if both are set)
         'max_age': 70,
         'binSize1': 64,
         'binSize2': 64,
@@ -36,160 +53,218 @@ def getParams(**kwargs):
     return ret_dir
 
 
-def detect(params, name='Default'):
+def detect(params, name='Default', workers: int = WORKERS):
     cur_path = IMAGES_PATH + 'data_ms4\\'
-    videos = loadFolderMileStone4(cur_path, getVideo=True, printInfo=False)
+    videos = loadFolderMileStone4(cur_path, getVideo=True, printInfo=False, getPath=True)
 
     # Prepare loaded data
     dects = [vid[0] for vid in videos]
     gts = [vid[1] for vid in videos]
-    video_inputs = [vid[2] for vid in videos]
+    video_paths = [vid[2] for vid in videos]
     seq_infos = [vid[3] for vid in videos]
 
     # Apply Filters
-    own_dects = confidenceFilter(params['confFilter'], dects)
-    own_dects = iouFilter(params['iouFilter'], own_dects)
-    own_dects = overlapFilter(own_dects)
-
+    own_dects = nmsFilter(params['confFilter'], params['iouFilter'], dects)
+
+    # own cache folder of the histogram stores, so they are not evicted by the background subtraction caches
+    histoCache = CacheManager('out/histos/', HISTO_BUDGET) if HISTO_CACHE else None
+
+    # Track every video; the videos share no state, so they can run in separate processes
+    jobs = (range(len(video_paths)), video_paths, gts, own_dects, dects, seq_infos)
+    if workers > 1 and not DISPLAY:
+        print(f'{name} -- Tracking {len(video_paths)} videos with {workers} processes')
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map keeps the order of the videos, so the evaluation is the same as in serial mode
+            accs = list(executor.map(partial(trackVideo, params, name, histoCache=histoCache), *jobs))
+    else:
+        accs = list(map(partial(trackVideo, params, name, histoCache=histoCache), *jobs))
+
+    # eval (the accumulators are already filled while tracking)
+    print(f'{name} -- Evaluating...')
+    summarizeMOTA(accs, name)
+
+
+def trackVideo(params, name, video_ID: int, video_path: str, gt_boxes: list[BoundingBox],
+               det_boxes: list[BoundingBox], all_det_boxes: list[BoundingBox],
+               seq_info: dict[str, str], histoCache: CacheManager = None) -> mm.MOTAccumulator:
+    """ Tracks the detections of one video (runs in a worker process in parallel mode)
+
+    :param params: the parameters of getParams
+    :param name: name of the run (used for the progress output)
+    :param video_ID: index of the video
+    :param video_path: path of the video file
+    :param gt_boxes: ground truth boxes of the video
+    :param det_boxes: filtered detections of the video
+    :param all_det_boxes: unfiltered detections of the video (rows of the histogram store)
+    :param seq_info: seq_info of the video
+    :param histoCache: manager of the histogram stores (None = a manager without budget, see HistogramStore)
+    :return: the MOT accumulator of the video
+    """
     # Parameters
     weights = np.array([params['weightDist'], params['weightSize'], params['weightIou'],
                         params['weightHistos']])  # (distance, size, iou, histogram)
     maxHistoInHistory = params['maxHistoInHistory']  # number of histos to keep in history
-    score_threshold = params['score_threshold']  # score threshold to be considered good enough match (less is better)
     MAX_AGE = params['max_age']  # max age of a 'lost' object before it is ignored
 
     # Only used by BorderFilter (currently not used)
     # borderWidth = 0.05
     # avgNewBoxSizeMultiplier = 3
 
-    for video_ID, video in enumerate(video_inputs):  # for each video
-
-        # only video x for debugging
-        # if video_ID != 1:
-        #    print('skipping video', video_ID + 1)
-        #    continue
-
-        # prepare bb's as dicts
-        gt_boxes = gts[video_ID]
-        gt_dict = prepareBBs(gt_boxes)
-        det_boxes = own_dects[video_ID]
-        det_dict = prepareBBs(det_boxes)
-
-        # video info
-        seq_info = seq_infos[video_ID]
-        fps = int(seq_info['framerate'])
-        vid_name = seq_info['name']
-        frame_count = int(seq_info['seqlength'])
-
-        frame_counter = 0
-
-        highestBoxId = (i for i in range(1, 1000000))  # auto increment; usage: next(highestBoxId)
-        history = {}  # key: box_id, value: [latest_bb, histo_history]
-        while True:
-            ret, frame = video.read()
-            frame_counter += 1
-            if not ret:
-                break
+    # prepare bb's as dicts
+    gt_dict = prepareBBs(gt_boxes)
+    det_dict = prepareBBs(det_boxes)
+    mota = StreamingMOTA(BoundingBoxArray.fromBoxes([box for box in gt_boxes if box.class_id in [1, None]]))
+
+    # video info
+    fps = int(seq_info['framerate'])
+    vid_name = seq_info['name']
+    frame_count = int(seq_info['seqlength'])
+    img_shape = (int(seq_info['imheight']), int(seq_info['imwidth']))
+
+    binSize = [params['binSize1'], params['binSize2']]
+    histoStore = HistogramStore(video_path, all_det_boxes, binSize, vid_name, cache=histoCache) if HISTO_CACHE \
+        else None
+    # the frame itself is only needed to calculate the histograms or to display/render it
+    decodeFrames = histoStore is None or DISPLAY or RENDER
+    video = FramePrefetcher(cv.VideoCapture(video_path)) if decodeFrames else None
+    renderer = VideoWriterThread(f'out/render/{vid_name}.mp4', fps) if RENDER else None
+
+    highestBoxId = (i for i in range(1, 1000000))  # auto increment; usage: next(highestBoxId)
+    tracks = TrackStore(MAX_AGE, maxHistoInHistory, params['histoEma'])  # only live tracks, older ones are evicted
+    # matches proposed by each stage of hungarianMatching and the ones accepted by the score threshold
+    matchStats = {'cascade': 0, 'hungarian': 0, 'scored': 0, 'accepted': 0}
+    profiler = Profiler(PROFILE, f'{name} -- Video {video_ID + 1}')
+    try:
+        for frame_counter in range(1, frame_count + 1):
+            profiler.frame = frame_counter
+            frame = None
+            if decodeFrames:
+                with profiler.section('video.read'):
+                    ret, frame = video.read()
+                if not ret:
+                    break
 
-            gt_boxes_in_frame: list[BoundingBox] = gt_dict[frame_counter]
-            det_boxes_in_frame: list[BoundingBox] = det_dict[frame_counter]
+            gt_boxes_in_frame: list[BoundingBox] = gt_dict.get(frame_counter, [])
+            det_boxes_in_frame: list[BoundingBox] = det_dict.get(frame_counter, [])
 
             # calc histo for each box
-            histos_in_frame = getHistosFromImgWithBBs(frame, det_boxes_in_frame,
-                                                      binSize=[params['binSize1'], params['binSize2']])
-
-            if frame_counter == 1:
-                # first frame; just id the boxes incrementally
-                for box in det_boxes_in_frame:
-                    box.box_id = next(highestBoxId)
-            else:
-                col_ind, row_ind, score_matrix = hungarianMatching(det_boxes_in_frame, frame, histos_in_frame,
-                                                                   frame_counter, history, weights, MAX_AGE)
-
-                # update ids from det_boxes_in_frame
-                for i, j in zip(row_ind, col_ind):
-                    if score_matrix[i, j] > score_threshold:
-                        # match is too bad, new id
-                        if j >= len(det_boxes_in_frame):  # out of bounds check (only happens due to quadratic matrix)
-                            continue
-                        det_boxes_in_frame[j].box_id = next(highestBoxId)
-                    else:
-                        det_boxes_in_frame[j].box_id = i + 1
-
-                """ DISABLED DUE TO BAD SCORES
-                borderFilter(avgNewBoxSizeMultiplier, borderWidth, det_boxes_in_frame, frame, frame_counter, history)
-                """
-
-            saveHistory(histos_in_frame, det_boxes_in_frame, history, maxHistoInHistory)
-
-            if DISPLAY:
-                overlay = None
-                new_frame = frame.copy()
-                # overlay for all gt_boxes (with alpha)
-                alpha = 0.4
-                for box in gt_boxes_in_frame:
-                    if box.box_id == -2:
-                        continue
-                    if not HIDE_GT:
-                        overlay = box.addBoxToImage(new_frame, (255, 255, 0), verbose=False, getOverlay=True,
-                                                    overrideOverlay=overlay)
-
-                if overlay is not None:  # apply all gt_boxes (overlay) on frame
-                    cv.addWeighted(overlay, alpha, new_frame, 1 - alpha, 0, new_frame)
-                overlay = None
-
-                # overlay for all det_boxes (without alpha)
-                for box in det_boxes_in_frame:
-                    if box.box_id == -2:
-                        continue
-                    if not HIDE_DET:
-                        overlay = box.addBoxToImage(new_frame, (255, 0, 255), verbose=False, getOverlay=True,
-                                                    overrideOverlay=overlay)
-
-                if overlay is not None:
-                    new_frame = overlay  # override frame with overlay, since we have no alpha for det_boxes
-
-                cv.waitKey(0)
-                if not playImageAsVideo(new_frame, fps, f'{vid_name} | {frame_count} frames'):
-                    cv.destroyAllWindows()
-                    break
+            with profiler.section('histograms'):
+                if histoStore is not None:
+                    histos_in_frame = histoStore.get(det_boxes_in_frame)
+                else:
+                    histos_in_frame = getHistosFromImgWithBBs(frame, det_boxes_in_frame, binSize=binSize)
+
+            profiler.count('detections', len(det_boxes_in_frame))
+            profiler.count('tracks', len(tracks))
+            scored = matchStats['scored']
+            with profiler.section('hungarianMatching'):
+                assignIds(params, weights, frame_counter, img_shape, det_boxes_in_frame, histos_in_frame, tracks,
+                          highestBoxId, matchStats)
+            profiler.count('scoredPairs', matchStats['scored'] - scored)
+            """ DISABLED DUE TO BAD SCORES
+            if frame_counter > 1:
+                borderFilter(avgNewBoxSizeMultiplier, borderWidth, det_boxes_in_frame, frame, frame_counter, tracks)
+            """
+
+            with profiler.section('tracks.update'):
+                tracks.update(histos_in_frame, det_boxes_in_frame)
+
+            # eval (all -2 boxes are ignored; only used in borderFilter)
+            with profiler.section('evaluation'):
+                tracked_boxes = [box for box in det_boxes_in_frame if box.box_id != -2]
+                mota.update(frame_counter, [box.box_id for box in tracked_boxes],
+                            [box.getTuple() for box in tracked_boxes])
+
+            if DISPLAY or RENDER:
+                with profiler.section('render'):
+                    # the frame is not used after this, so the boxes are drawn directly onto it
+                    annotateFrame(frame, gt_boxes_in_frame, det_boxes_in_frame)
+                if RENDER:
+                    renderer.write(frame)
+                if DISPLAY:
+                    cv.waitKey(0)
+                    if not playImageAsVideo(frame, fps, f'{vid_name} | {frame_count} frames'):
+                        cv.destroyAllWindows()
+                        break
 
             if frame_counter % 100 == 0:  # prints every 100 frames
-                print(f'{name} -- Video {video_ID + 1} | {frame_counter} / {frame_count} frames')
-
-        print(f'{name} -- Video {video_ID + 1} | Done')
-
-    # cleanup (delete all -2 boxes)
-    print(f'{name} -- Cleaning up...')
-    for video_ID, video in enumerate(own_dects):
-        own_dects[video_ID] = [box for box in video if box.box_id != -2]  # only used in borderFilter
-
-    # eval
-    print(f'{name} -- Evaluating...')
-    own_dects = [[box.toDetectionString() for box in boxes] for boxes in own_dects]
-    gts = [[box.toDetectionString() for box in boxes if box.class_id in [1, None]] for boxes in gts]
-    evalMOTA(own_dects, gts, name)
-
-
-def saveHistory(histos_in_frame, boxesInFrame, history, maxHistos):
-    """ Saves the histos plus the box itself of the current frame to the history dict
-
-    :param histos_in_frame: list of histos
-    :param boxesInFrame: list of boxes
-    :param history: the history
-    :param maxHistos: max number of histos to keep in history
-    :return:
+                print(f'{name} -- Video {video_ID + 1} | {frame_counter} / {frame_count} frames', flush=True)
+    finally:
+        # also stops the decoding thread if the tracking fails (it would block on the full queue otherwise)
+        # and finishes the rendered video, so the frames up to the error are playable
+        try:
+            if renderer is not None:
+                renderer.release()
+        finally:
+            if video is not None:
+                video.release()
+
+    print(f'{name} -- Video {video_ID + 1} | Matches: {matchStats["accepted"]} accepted of '
+          f'{matchStats["cascade"]} proposed by cascade and {matchStats["hungarian"]} proposed by hungarian '
+          f'({matchStats["scored"]} scored pairs)', flush=True)
+    profiler.printSummary()
+    profiler.saveTrace(f'out/profile/{vid_name}.json')
+    if renderer is not None:
+        print(f'{name} -- Video {video_ID + 1} | Rendered {renderer.frames} frames to {renderer.path}', flush=True)
+    if decodeFrames:
+        # a long wait means decode-bound, a short one compute-bound
+        print(f'{name} -- Video {video_ID + 1} | Done ({video})', flush=True)
+    else:
+        print(f'{name} -- Video {video_ID + 1} | Done', flush=True)
+    return mota.acc
+
+
+def annotateFrame(frame: np.ndarray, gt_boxes_in_frame: list[BoundingBox],
+                  det_boxes_in_frame: list[BoundingBox]) -> np.ndarray:
+    """ Draws the gt boxes (transparent) and the tracked boxes (opaque) onto the frame (in place)
+
+    :param frame: the frame
+    :param gt_boxes_in_frame: the gt boxes of the frame
+    :param det_boxes_in_frame: the tracked boxes of the frame
+    :return: the frame
     """
-    for box_in_frame, histo in zip(boxesInFrame, histos_in_frame):
-        if box_in_frame.box_id == -2:
-            continue
-        if box_in_frame.box_id not in history:
-            history[box_in_frame.box_id] = [box_in_frame, [histo]]
-        else:
-            history[box_in_frame.box_id][0] = box_in_frame
-            history[box_in_frame.box_id][1].append(histo)
-            if len(history[box_in_frame.box_id][1]) >= maxHistos:
-                history[box_in_frame.box_id][1].pop(0)
+    # all -2 boxes are ignored
+    if not HIDE_GT:
+        drawBoxes(frame, [box for box in gt_boxes_in_frame if box.box_id != -2], (255, 255, 0), alpha=0.4)
+    if not HIDE_DET:
+        drawBoxes(frame, [box for box in det_boxes_in_frame if box.box_id != -2], (255, 0, 255))
+    return frame
+
+
+def assignIds(params, weights, frame_counter: int, img_shape: tuple, det_boxes_in_frame: list[BoundingBox],
+              histos_in_frame: list[np.ndarray], tracks: TrackStore, highestBoxId, matchStats: dict[str, int]) -> None:
+    """ Sets the id of every box of a frame to the id of its matched track (or a new id)
+
+    :param params: the parameters of getParams
+    :param weights: the weights of the score (distance, size, iou, histogram)
+    :param frame_counter: the current frame
+    :param img_shape: the shape of the frames
+    :param det_boxes_in_frame: the boxes of the frame
+    :param histos_in_frame: the histograms of the boxes
+    :param tracks: all tracks (expired tracks are pruned)
+    :param highestBoxId: generator of new ids
+    :param matchStats: number of matches proposed by each stage of hungarianMatching and 'accepted' (score threshold)
+    """
+    if frame_counter == 1:
+        # first frame; just id the boxes incrementally
+        for box in det_boxes_in_frame:
+            box.box_id = next(highestBoxId)
+        return
+
+    tracks.prune(frame_counter)
+    row_ind, col_ind, track_ids, scores = hungarianMatching(det_boxes_in_frame, img_shape, histos_in_frame, tracks,
+                                                            weights, params['gateDistance'], params['cascadeIou'],
+                                                            matchStats, params['gateIou'])
+
+    # update ids from det_boxes_in_frame
+    matched = {}
+    for i, j, score in zip(row_ind, col_ind, scores):
+        if score <= params['score_threshold']:  # score threshold to be considered good enough match (less is better)
+            matched[j] = track_ids[i]
+    matchStats['accepted'] = matchStats.get('accepted', 0) + len(matched)
+    for j, box in enumerate(det_boxes_in_frame):
+        # unmatched or match is too bad, new id
+        box.box_id = matched[j] if j in matched else next(highestBoxId)
 
 
 def prepareBBs(bbs):